@@ -1,6 +1,12 @@
 from podcast.models import ParentCategory, ChildCategory, MediaCategory
 from podcast.models import Show, Enclosure, Episode
+from podcast.forms import EnclosureForm, RescheduleForm, enclosure_form
+from podcast import bulk, settings, uploads
+from django.conf.urls.defaults import patterns, url
 from django.contrib import admin
+from django.contrib.admin import helpers
+from django.shortcuts import render_to_response
+from django.template import RequestContext
 
 class CategoryInline(admin.StackedInline):
     model = ChildCategory
@@ -22,7 +28,7 @@ class MediaCategoryAdmin(admin.ModelAdmin):
 
 class ShowAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ("title",)}
-    list_display = ('title', 'organization')
+    list_display = ('title', 'organization', 'episode_count', 'latest_date')
     list_filter = ('title', 'organization')
     fieldsets = (
         (None, {
@@ -40,25 +46,90 @@ class ShowAdmin(admin.ModelAdmin):
 
 class EnclosureInline(admin.StackedInline):
     model = Enclosure
+    form = EnclosureForm
     extra = 1
     fieldsets = (
         (None, {
-            'fields': ('title', 'file', 'mime', 'medium', 'expression', 
-                       'frame', 'bitrate', 'sample', 'channel', 'algo', 
-                       'hash', 'player', 'embed', ('width', 'height')),
+            'fields': ('title', 'file', 'upload', 'mime', 'medium', 
+                       'expression', 'frame', 'bitrate', 'sample', 
+                       'channel', 'algo', 'hash', 'player', 'embed', 
+                       ('width', 'height')),
             'description': ('''Only the last <em>saved</em> enclosure is 
                               displayed in plain RSS and iTunes feeds''')
         }),
     )
 
+    def get_formset(self, request, obj=None, **kwargs):
+        kwargs['form'] = enclosure_form(request.user)
+        return super(EnclosureInline, self).get_formset(request, obj, 
+            **kwargs)
+
 
 class EnclosureAdmin(admin.ModelAdmin):
+    form = EnclosureForm
     list_display = ('title', 'file', 'player', 'mime')
     list_filter = ('mime',)
 
+    def get_form(self, request, obj=None, **kwargs):
+        kwargs['form'] = enclosure_form(request.user)
+        return super(EnclosureAdmin, self).get_form(request, obj, **kwargs)
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.module_name
+        return patterns('',
+            url(r'^upload/$', 
+                self.admin_site.admin_view(uploads.start_view), 
+                name='%s_%s_upload' % info),
+            url(r'^upload/(?P<token>\w+)/$', 
+                self.admin_site.admin_view(uploads.upload_view), 
+                name='%s_%s_upload_chunk' % info),
+        ) + super(EnclosureAdmin, self).get_urls()
+
+
+def _bulk_action(name, description, operation, *args):
+    def action(modeladmin, request, queryset):
+        count = operation(queryset, *args)
+        modeladmin.message_user(request, '%d episodes updated.' % count)
+    action.__name__ = name
+    action.short_description = description
+    return action
+
+
+def reschedule(modeladmin, request, queryset):
+    """Asks for the new date on an intermediate page."""
+    if 'apply' in request.POST:
+        form = RescheduleForm(request.POST)
+        if form.is_valid():
+            count = bulk.reschedule(queryset, form.cleaned_data['date'])
+            modeladmin.message_user(request, 
+                '%d episodes rescheduled.' % count)
+            return None
+    else:
+        form = RescheduleForm()
+    return render_to_response('admin/podcast/episode/reschedule.html', {
+        'title': 'Reschedule episodes',
+        'form': form,
+        'queryset': queryset,
+        'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+    }, context_instance=RequestContext(request))
+reschedule.short_description = 'Reschedule selected episodes'
+
 
 class EpisodeAdmin(admin.ModelAdmin):
     inlines = [EnclosureInline,]
+    actions = [
+        _bulk_action('publish', 'Publish selected episodes', bulk.publish),
+        _bulk_action('unpublish', 'Unpublish selected episodes', 
+            bulk.unpublish),
+        reschedule,
+        _bulk_action('block', 'Block selected episodes from iTunes', 
+            bulk.set_block, True),
+        _bulk_action('unblock', 'Unblock selected episodes', 
+            bulk.set_block, False),
+    ] + [_bulk_action('explicit_%s' % value.lower(), 
+                      'Mark selected episodes explicit: %s' % label, 
+                      bulk.set_explicit, value) 
+         for value, label in settings.EXPLICIT_CHOICES]
     prepopulated_fields = {'slug': ("title",)}
     list_display = ('title', 'update', 'show')
     list_filter = ('show', 'update')
@@ -0,0 +1,181 @@
+"""
+Content-addressed storage of enclosure files.
+
+``BlobStorage`` is the storage of ``Enclosure.file``. Saving a file
+streams it to a temporary name while computing its SHA-1, then keeps it
+under ``PODCAST_BLOB_DIR`` named after that hash, unless a file with the
+same content is already stored, in which case the new copy is dropped and
+the existing name is returned. Every stored file has a ``Blob`` row with
+the number of enclosures that point at it. Blobs are never deleted when an
+enclosure goes away; ``podcast_gc`` removes the ones nothing refers to
+and nothing stored again or let go of for ``PODCAST_BLOB_GRACE`` seconds,
+and ``podcast_dedupe`` folds the copies of files stored before.
+
+Files stored under any other name, e.g. before this storage was used, are
+read and deleted as usual.
+"""
+import datetime
+import errno
+import hashlib
+import os
+import uuid
+
+from django.core.files.base import File
+from django.core.files.storage import Storage, default_storage
+from django.db.models import F
+
+from podcast import settings
+
+ALGO = 'SHA-1'
+
+
+class HashingFile(File):
+    """Passes the content of another file through, hashing it."""
+
+    def __init__(self, content):
+        super(HashingFile, self).__init__(content, content.name)
+        self.hasher = hashlib.sha1()
+        self.bytes_read = 0
+
+    def _count(self, data):
+        self.hasher.update(data)
+        self.bytes_read += len(data)
+        return data
+
+    def chunks(self, chunk_size=None):
+        for data in self.file.chunks():
+            yield self._count(data)
+
+    def __iter__(self):
+        return self.chunks()
+
+    def read(self, num_bytes=None):
+        if num_bytes is None:
+            return self._count(self.file.read())
+        return self._count(self.file.read(num_bytes))
+
+    def close(self):
+        pass
+
+
+def blob_name(digest, name):
+    """Names a blob by its ``digest`` and the extension of ``name``."""
+    extension = os.path.splitext(name)[1].lower()
+    return '%s%s/%s%s' % (settings.BLOB_DIR, digest[:2], digest, extension)
+
+
+def _blob_model():
+    from podcast.models import Blob
+    return Blob
+
+
+class BlobStorage(Storage):
+    """Stores files by content in ``inner``, the default storage."""
+
+    def __init__(self, inner=None):
+        self.inner = inner or default_storage
+
+    def get_available_name(self, name):
+        # The name is chosen from the content in _save().
+        return name
+
+    def _open(self, name, mode='rb'):
+        return self.inner.open(name, mode)
+
+    def _save(self, name, content):
+        content = HashingFile(content)
+        temporary = self.inner.save('%stmp/%s' % (settings.BLOB_DIR,
+            uuid.uuid4().hex), content)
+        digest = content.hasher.hexdigest()
+        blob, created = _blob_model().objects.get_or_create(hash=digest,
+            defaults={'name': blob_name(digest, name),
+                      'size': content.bytes_read})
+        if not created:
+            # Keeps podcast_gc off the file until it is referenced.
+            _blob_model().objects.filter(pk=blob.pk).update(
+                used=datetime.datetime.now())
+        if created or not self.inner.exists(blob.name):
+            self.promote(temporary, blob.name)
+        else:
+            self.inner.delete(temporary)
+        return blob.name
+
+    def promote(self, temporary, name):
+        """Moves a stored file to ``name``, renaming it where possible."""
+        try:
+            source = self.inner.path(temporary)
+            target = self.inner.path(name)
+        except NotImplementedError:
+            f = self.inner.open(temporary, 'rb')
+            try:
+                self.inner.save(name, f)
+            finally:
+                f.close()
+            self.inner.delete(temporary)
+            return
+        try:
+            os.makedirs(os.path.dirname(target))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        os.rename(source, target)
+
+    def delete(self, name):
+        # Blobs may be shared; podcast_gc removes unreferenced ones.
+        if not _blob_model().objects.filter(name=name).exists():
+            self.inner.delete(name)
+
+    def exists(self, name):
+        return self.inner.exists(name)
+
+    def listdir(self, path):
+        return self.inner.listdir(path)
+
+    def path(self, name):
+        return self.inner.path(name)
+
+    def size(self, name):
+        return self.inner.size(name)
+
+    def url(self, name):
+        return self.inner.url(name)
+
+storage = BlobStorage()
+
+
+def add_reference(name, count=1):
+    if name:
+        _blob_model().objects.filter(name=name).update(
+            refs=F('refs') + count, used=datetime.datetime.now())
+
+
+def enclosure_pre_save(sender, instance, **kwargs):
+    """Remembers the stored file name to compare after saving."""
+    old = None
+    if instance.pk is not None:
+        old = sender._default_manager.filter(pk=instance.pk).values_list(
+            'file', flat=True)[:1]
+        old = old and old[0] or None
+    instance._stored_file = old
+
+
+def enclosure_saved(sender, instance, **kwargs):
+    """Moves the reference and fills in the hash of a blob."""
+    old = getattr(instance, '_stored_file', None) or ''
+    new = instance.file.name or ''
+    if old == new:
+        return
+    add_reference(old, -1)
+    add_reference(new)
+    instance._stored_file = new
+    if new and (not instance.hash or instance.algo == ALGO):
+        digest = _blob_model().objects.filter(name=new).values_list('hash',
+            flat=True)[:1]
+        if digest:
+            sender._default_manager.filter(pk=instance.pk).update(algo=ALGO,
+                hash=digest[0])
+            instance.algo, instance.hash = ALGO, digest[0]
+
+
+def enclosure_deleted(sender, instance, **kwargs):
+    add_reference(instance.file.name, -1)
@@ -0,0 +1,86 @@
+"""
+Set-based changes to many episodes at once.
+
+Every operation is a single ``UPDATE`` inside a transaction, followed by
+one ``shows_changed`` notification naming the affected shows, instead of a
+save and a notification per episode. Used by the episode admin actions and
+the ``podcast_bulk`` management command.
+"""
+import datetime
+
+from django.db import router, transaction
+
+from podcast import delta, related, settings
+from podcast.models import Episode, Show
+from podcast.signals import schedule_publication, shows_changed
+
+
+def update_episodes(queryset, **values):
+    """
+    Sets ``values`` on the episodes of ``queryset`` and returns how many
+    were changed.
+    """
+    using = router.db_for_write(Episode)
+    queryset = queryset.using(using).order_by()
+    now = datetime.datetime.now()
+    values['update'] = now
+
+    # Episodes that are public after the change and go live later.
+    scheduled = queryset
+    if 'status' in values:
+        if values['status'] != 2:
+            scheduled = scheduled.none()
+    else:
+        scheduled = scheduled.filter(status=2)
+
+    def apply():
+        show_ids = set(queryset.values_list('show', flat=True).distinct())
+        if 'date' in values:
+            due = []
+            if values['date'] > now:
+                due = [(show_id, values['date']) for show_id in
+                       scheduled.values_list('show', flat=True).distinct()]
+        else:
+            due = list(scheduled.filter(date__gt=now).values_list(
+                'show', 'date').distinct())
+        pks = []
+        if 'status' in values:
+            # Episodes joining or leaving the related episode lists
+            pks = list(queryset.values_list('pk', flat=True))
+        return show_ids, due, pks, queryset.update(**values)
+
+    # Notify once the change is committed and visible to other requests.
+    show_ids, due, pks, count = transaction.commit_on_success(using=using)(
+        apply)()
+    shows = dict((show.pk, show) for show in
+                 Show.objects.using(using).filter(pk__in=show_ids))
+    for show in shows.values():
+        # Deltas cannot express episodes that were withdrawn.
+        delta.forget(show.slug)
+    for show_id, date in due:
+        schedule_publication(Episode, shows[show_id], date)
+    if shows:
+        shows_changed.send(sender=Episode, shows=list(shows.values()))
+    for pk in pks:
+        related.worker.add(pk, pk, settings.RELATED_DELAY)
+    return count
+
+
+def publish(queryset):
+    return update_episodes(queryset, status=2)
+
+
+def unpublish(queryset):
+    return update_episodes(queryset, status=1)
+
+
+def reschedule(queryset, date):
+    return update_episodes(queryset, date=date)
+
+
+def set_block(queryset, block):
+    return update_episodes(queryset, block=block)
+
+
+def set_explicit(queryset, explicit):
+    return update_episodes(queryset, explicit=explicit)
@@ -0,0 +1,114 @@
+"""
+Precompression of rendered feeds and sitemaps.
+
+Feeds are large and highly repetitive XML documents. Rather than letting
+every request compress the same bytes again, the compressed variants are
+built once, stored next to the rendered document and picked per request
+from the ``Accept-Encoding`` header.
+"""
+import gzip
+import io
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from podcast import settings
+
+
+def _gzip(content):
+    buf = io.BytesIO()
+    # A fixed mtime keeps the compressed bytes stable for equal content.
+    f = gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=9, mtime=0)
+    try:
+        f.write(content)
+    finally:
+        f.close()
+    return buf.getvalue()
+
+
+def _brotli(content):
+    return brotli.compress(content, quality=11)
+
+
+def _zstd(content):
+    return zstandard.ZstdCompressor(level=19).compress(content)
+
+
+COMPRESSORS = {'gzip': _gzip}
+if brotli is not None:
+    COMPRESSORS['br'] = _brotli
+if zstandard is not None:
+    COMPRESSORS['zstd'] = _zstd
+
+
+def available_encodings():
+    """Configured content-codings that can be produced here, by preference."""
+    return [e for e in settings.PRECOMPRESS_ENCODINGS if e in COMPRESSORS]
+
+
+def compress_variants(content):
+    """
+    Returns a dictionary mapping content-coding to compressed bytes.
+
+    Variants that would not be smaller than the original are left out, as
+    is everything for documents below ``PRECOMPRESS_MIN_LENGTH``.
+    """
+    variants = {}
+    if len(content) < settings.PRECOMPRESS_MIN_LENGTH:
+        return variants
+    for encoding in available_encodings():
+        compressed = COMPRESSORS[encoding](content)
+        if len(compressed) < len(content):
+            variants[encoding] = compressed
+    return variants
+
+
+def parse_accept_encoding(header):
+    """
+    Parses an ``Accept-Encoding`` header into a dictionary of
+    content-coding to quality value.
+    """
+    accepted = {}
+    for part in header.split(','):
+        params = part.strip().split(';')
+        coding = params[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params[1:]:
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(header, variants):
+    """
+    Picks the best of the stored ``variants`` for an ``Accept-Encoding``
+    header. Returns ``None`` when the identity representation should be
+    served.
+    """
+    if not header or not variants:
+        return None
+    accepted = parse_accept_encoding(header)
+    if 'x-gzip' in accepted and 'gzip' not in accepted:
+        accepted['gzip'] = accepted['x-gzip']
+    best, best_q = None, 0.0
+    for encoding in available_encodings():
+        if encoding not in variants:
+            continue
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
@@ -0,0 +1,151 @@
+"""
+RFC 3229 delta encoding of the RSS and Atom feeds ("A-IM: feed").
+
+Every time a feed is rendered, its digest is remembered in a short
+per-show list together with the time of rendering. A client that sends
+``A-IM: feed`` and the ETag of a remembered version gets ``226 IM Used``
+with the channel and only the episodes published or changed since then,
+which it merges into its copy. Clients without delta support, and clients
+whose version is unknown or too old, get the whole feed as before.
+
+A render may miss episodes saved just before it, in transactions that
+had not committed yet or that a lagging replica did not have yet, so a
+version is remembered as rendered ``PODCAST_DELTA_MARGIN`` seconds
+earlier than it was. Deltas overlap by that much, which is harmless as
+clients merge items by guid.
+
+The delta cannot express episodes that disappeared, so unpublishing or
+deleting an episode forgets the remembered versions of its show and the
+next poll receives the whole feed.
+"""
+import datetime
+
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Q
+from django.http import HttpResponse
+
+from podcast import feedcache, settings
+
+VERSIONS_KEY = 'podcast:delta:%s'
+VERSIONS_TIMEOUT = feedcache.VERSION_TIMEOUT
+
+
+def wants_delta(request):
+    """Returns ``True`` if the client accepts the ``feed`` manipulation."""
+    for token in request.META.get('HTTP_A_IM', '').split(','):
+        if token.split(';')[0].strip().lower() == 'feed':
+            return True
+    return False
+
+
+def _digests(header):
+    """Yields the document digests named in an ``If-None-Match`` header."""
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        if tag:
+            # Strip the content-coding suffix of feedcache ETags.
+            yield tag.split('-')[0]
+
+
+def remember(slug, digest, rendered):
+    """Records that the document with ``digest`` was rendered at a time."""
+    key = VERSIONS_KEY % slug
+    versions = [v for v in cache.get(key, []) if v[0] != digest]
+    versions.insert(0, (digest, rendered))
+    cache.set(key, versions[:settings.DELTA_VERSIONS], VERSIONS_TIMEOUT)
+
+
+def forget(slug):
+    """Forgets the remembered versions of the show with ``slug``."""
+    cache.delete(VERSIONS_KEY % slug)
+
+
+def base_version(request, slug):
+    """
+    Returns the digest and rendering time of the newest remembered version
+    the client has, or ``None``.
+    """
+    versions = dict(cache.get(VERSIONS_KEY % slug, []))
+    for digest in _digests(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        if digest in versions:
+            return digest, versions[digest]
+    return None
+
+
+def changed_since(episodes, rendered):
+    """
+    Restricts ``episodes`` to those changed or gone live after
+    ``rendered``. Both columns are indexed.
+    """
+    return episodes.filter(Q(update__gt=rendered) | Q(date__gt=rendered))
+
+
+def serve_delta(request, entry, delta):
+    """
+    Serves the rendered ``delta`` as ``226 IM Used``. The ETag is that of
+    the whole feed, which is what the client holds after merging.
+    """
+    response, encoding = feedcache.entry_response(request, delta)
+    response.status_code = 226
+    response['IM'] = 'feed'
+    response['ETag'] = '"%s"' % entry['digest']
+    # Only caches that understand instance manipulations may store this.
+    response['Cache-Control'] = 'no-store, im'
+    return response
+
+
+def cached_feed(request, slug, name, render):
+    """
+    Serves a feed through the document cache like
+    ``feedcache.cached_document``, answering ``A-IM: feed`` requests for a
+    remembered version with a delta. ``render`` takes an optional time and
+    renders the feed with only the episodes changed since then.
+    """
+    rendered = []
+
+    def render_full():
+        rendered.append(datetime.datetime.now() - datetime.timedelta(
+            seconds=settings.DELTA_MARGIN))
+        return render()
+
+    entry = feedcache.cached_entry(slug, name, render_full)
+    if isinstance(entry, HttpResponse):
+        return entry
+    if rendered:
+        remember(slug, entry['digest'], rendered[0])
+    if wants_delta(request) and not feedcache.etag_matches(
+            request.META.get('HTTP_IF_NONE_MATCH', ''), entry['digest']):
+        base = base_version(request, slug)
+        if base is not None:
+            digest, since = base
+            # A previous delta would not lead to the ETag sent with it.
+            delta = feedcache.cached_entry(slug,
+                '%s:delta:%s' % (name, digest), lambda: render(since),
+                stale=False)
+            if not isinstance(delta, HttpResponse):
+                return serve_delta(request, entry, delta)
+    return feedcache.serve_entry(request, entry)
+
+
+def _forget_show(get_show):
+    try:
+        show = get_show()
+    except ObjectDoesNotExist:
+        return
+    forget(show.slug)
+
+
+def episode_saved(sender, instance, created=False, **kwargs):
+    """Forgets the versions of the show when an episode is withdrawn."""
+    if created or (instance.status == 2 and
+                   instance.date <= datetime.datetime.now()):
+        return
+    _forget_show(lambda: instance.show)
+
+
+def episode_deleted(sender, instance, **kwargs):
+    _forget_show(lambda: instance.show)
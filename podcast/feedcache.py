@@ -0,0 +1,175 @@
+"""
+Versioned cache of rendered feeds and sitemaps.
+
+Every show has a version token in the cache which is replaced whenever the
+show, one of its episodes or one of their enclosures changes (see
+``podcast.signals``). Rendered documents are cached under that version
+together with their precompressed variants, so a document is rendered and
+compressed once per content change and afterwards served straight from the
+cache with the right ``Content-Encoding``, ``Content-Length``, ``ETag`` and
+``Vary`` headers.
+
+Only one request renders a missing document at a time. Concurrent
+requests for it get the previous version of the document, if there is
+one, instead of each rendering it and holding a worker meanwhile.
+"""
+import hashlib
+import uuid
+
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+
+from podcast import settings
+from podcast.compression import choose_encoding, compress_variants
+
+VERSION_KEY = 'podcast:version:%s'
+DOCUMENT_KEY = 'podcast:document:%s:%s:%s'
+STALE_KEY = 'podcast:stale:%s:%s'
+RENDER_LOCK_KEY = 'podcast:rendering:%s'
+# Version tokens only need to outlive the documents cached under them.
+VERSION_TIMEOUT = 60 * 60 * 24 * 30
+# Headers of the rendered response that are cached with the document
+KEPT_HEADERS = ('Cache-Control',)
+
+
+def _new_version():
+    return uuid.uuid4().hex[:16]
+
+
+def show_version(slug):
+    """Returns the current version token of the show with ``slug``."""
+    key = VERSION_KEY % slug
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), VERSION_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(slug):
+    """Invalidates every cached document of the show with ``slug``."""
+    cache.set(VERSION_KEY % slug, _new_version(), VERSION_TIMEOUT)
+
+
+def document_key(slug, name):
+    return DOCUMENT_KEY % (slug, hashlib.md5(name).hexdigest(),
+        show_version(slug))
+
+
+def stale_key(slug, name):
+    """Key of the last rendered version of a document."""
+    return STALE_KEY % (slug, hashlib.md5(name).hexdigest())
+
+
+def _etag(entry, encoding):
+    if encoding:
+        return '"%s-%s"' % (entry['digest'], encoding)
+    return '"%s"' % entry['digest']
+
+
+def etag_matches(header, digest):
+    """
+    Returns ``True`` if an ``If-None-Match`` header names any representation
+    of the document with ``digest``.
+    """
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return True
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        if tag == digest or tag.startswith(digest + '-'):
+            return True
+    return False
+
+
+def build_entry(response):
+    """Turns a rendered response into a cache entry with its variants."""
+    content = response.content
+    return {
+        'content': content,
+        'content_type': response['Content-Type'],
+        'digest': hashlib.md5(content).hexdigest(),
+        'variants': compress_variants(content),
+        'headers': dict((name, response[name]) for name in KEPT_HEADERS
+                        if response.has_header(name)),
+    }
+
+
+def entry_response(request, entry):
+    """
+    Returns a response with the best representation of a cache entry for
+    ``request``, and the chosen content-coding (``None`` for identity).
+    """
+    encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''),
+        entry['variants'])
+    if encoding:
+        body = entry['variants'][encoding]
+    else:
+        body = entry['content']
+    response = HttpResponse(body, content_type=entry['content_type'])
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Content-Length'] = str(len(body))
+    if entry['variants']:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    return response, encoding
+
+
+def serve_entry(request, entry):
+    """Serves a cache entry, or ``304 Not Modified`` if the client has it."""
+    if etag_matches(request.META.get('HTTP_IF_NONE_MATCH', ''),
+                    entry['digest']):
+        encoding = choose_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''), entry['variants'])
+        response = HttpResponseNotModified()
+        if entry['variants']:
+            patch_vary_headers(response, ('Accept-Encoding',))
+    else:
+        response, encoding = entry_response(request, entry)
+    response['ETag'] = _etag(entry, encoding)
+    for name, value in entry.get('headers', {}).items():
+        response[name] = value
+    return response
+
+
+def cached_entry(slug, name, render, stale=True):
+    """
+    Returns the cache entry of the document ``name`` of the show with
+    ``slug``, calling ``render`` to build it on a miss. Only successful
+    responses are cached; anything else returned by ``render`` is returned
+    instead of an entry. Without ``stale``, the previous version is never
+    returned instead.
+    """
+    key = document_key(slug, name)
+    entry = cache.get(key)
+    if entry is not None:
+        return entry
+    lock = RENDER_LOCK_KEY % key
+    locked = cache.add(lock, 1, settings.RENDER_LOCK_TIMEOUT)
+    if stale and not locked:
+        entry = cache.get(stale_key(slug, name))
+        if entry is not None:
+            return entry
+    try:
+        response = render()
+        if response.status_code != 200:
+            return response
+        entry = build_entry(response)
+        cache.set(key, entry, settings.FEED_CACHE_TIMEOUT)
+        if stale:
+            cache.set(stale_key(slug, name), entry, VERSION_TIMEOUT)
+    finally:
+        if locked:
+            cache.delete(lock)
+    return entry
+
+
+def cached_document(request, slug, name, render):
+    """Serves a document of a show through the cache."""
+    entry = cached_entry(slug, name, render)
+    if isinstance(entry, HttpResponse):
+        return entry
+    return serve_entry(request, entry)
@@ -0,0 +1,75 @@
+from django import forms
+from django.contrib.admin.widgets import AdminSplitDateTime
+from django.core.urlresolvers import reverse
+from django.forms.util import flatatt
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from podcast.models import Enclosure, Upload
+from podcast.uploads import attach
+
+
+class ChunkedUploadWidget(forms.Widget):
+    """
+    A file chooser that sends the file in resumable chunks from the browser
+    and submits only the token of the finished upload.
+    """
+
+    class Media:
+        js = ('podcast/chunked_upload.js',)
+
+    def render(self, name, value, attrs=None):
+        final_attrs = self.build_attrs(attrs, type='hidden', name=name)
+        if value:
+            final_attrs['value'] = value
+        return mark_safe(u'''<input%s />
+<input type="file" class="podcast-chunked-upload" data-target="%s"
+  data-url="%s" />
+<span class="podcast-chunked-upload-status"></span>''' % (
+            flatatt(final_attrs), escape(final_attrs.get('id', '')),
+            reverse('admin:podcast_enclosure_upload')))
+
+
+class EnclosureForm(forms.ModelForm):
+    upload = forms.CharField(label='Large file', required=False,
+        widget=ChunkedUploadWidget,
+        help_text='''Use instead of File for large media. The upload can be
+                     resumed if it is interrupted; save once it reports
+                     that it is complete.''')
+
+    # Set by enclosure_form(); only this user's uploads are accepted.
+    user = None
+
+    class Meta:
+        model = Enclosure
+
+    def clean_upload(self):
+        token = self.cleaned_data['upload']
+        if not token:
+            return None
+        try:
+            upload = Upload.objects.get(token=token, user=self.user)
+        except Upload.DoesNotExist:
+            raise forms.ValidationError('This upload no longer exists.')
+        if not upload.complete():
+            raise forms.ValidationError('This upload has not finished yet.')
+        return upload
+
+    def save(self, commit=True):
+        enclosure = super(EnclosureForm, self).save(commit=False)
+        upload = self.cleaned_data.get('upload')
+        if upload is not None:
+            attach(enclosure, upload)
+        if commit:
+            enclosure.save()
+        return enclosure
+
+
+def enclosure_form(user):
+    """Returns an ``EnclosureForm`` accepting the uploads of ``user``."""
+    return type('EnclosureForm', (EnclosureForm,), {'user': user})
+
+
+class RescheduleForm(forms.Form):
+    date = forms.DateTimeField(widget=AdminSplitDateTime, 
+        help_text='Episodes with a future date go live at that time.')
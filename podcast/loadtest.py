@@ -0,0 +1,268 @@
+"""
+Simulated podcatcher traffic against the podcast views.
+
+A pool of threads sends requests either straight into the Django WSGI
+handler in the same process, or to a server running on a local URL. Shows
+are picked with a Zipf (long tail) popularity, endpoints with a weighted
+mix, and clients that already fetched a URL revalidate it with
+``If-None-Match`` at a given rate. Latencies are collected per endpoint.
+Nothing leaves the machine unless a URL is given.
+"""
+import bisect
+import io
+import math
+import random
+import threading
+import time
+import urllib2
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.urlresolvers import reverse
+from django.db import connections
+
+from podcast.models import Episode, Show
+
+# Default share of requests per endpoint, by URL name.
+MIX = (
+    ('podcast_feed', 55),
+    ('podcast_atom', 10),
+    ('podcast_media', 10),
+    ('podcast_sitemap', 5),
+    ('podcast_episodes', 10),
+    ('podcast_episode', 8),
+    ('podcast_shows', 2),
+)
+# Status recorded for requests that raised instead of getting a response
+FAILED = 0
+
+
+class WeightedChoice(object):
+    """Picks items with probability proportional to their weight."""
+
+    def __init__(self, items, weights):
+        self.items = list(items)
+        self.totals = []
+        total = 0
+        for weight in weights:
+            total += weight
+            self.totals.append(total)
+
+    def pick(self, rng):
+        return self.items[bisect.bisect(self.totals,
+            rng.random() * self.totals[-1])]
+
+
+def zipf_choice(items, exponent):
+    """The ``k``-th of ``items`` is picked with weight ``1 / k**exponent``."""
+    return WeightedChoice(items,
+        [1.0 / (rank ** exponent) for rank in range(1, len(items) + 1)])
+
+
+def parse_mix(text):
+    """Parses ``"podcast_feed=50,podcast_atom=10"`` into a mix."""
+    mix = []
+    for part in text.split(','):
+        name, weight = part.split('=')
+        mix.append((name.strip(), float(weight)))
+    return mix
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of a sorted list."""
+    if not ordered:
+        return 0.0
+    index = int(math.ceil(fraction * len(ordered))) - 1
+    return ordered[max(index, 0)]
+
+
+class WSGIFetcher(object):
+    """Calls the Django WSGI handler in this process."""
+
+    def __init__(self):
+        self.handler = WSGIHandler()
+
+    def __call__(self, path, headers):
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'SCRIPT_NAME': '',
+            'PATH_INFO': path,
+            'QUERY_STRING': '',
+            'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(),
+            'wsgi.errors': io.BytesIO(),
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in headers.items():
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+        started = []
+
+        def start_response(status, response_headers, exc_info=None):
+            started.append((int(status.split()[0]), dict(
+                (k.lower(), v) for k, v in response_headers)))
+
+        result = self.handler(environ, start_response)
+        try:
+            for chunk in result:
+                pass
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return started[0]
+
+
+class HTTPFetcher(object):
+    """Requests a running server, e.g. ``http://127.0.0.1:8000``."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def __call__(self, path, headers):
+        request = urllib2.Request(self.base_url + path, headers=headers)
+        try:
+            response = urllib2.urlopen(request)
+        except urllib2.HTTPError as e:
+            # Includes 304 Not Modified
+            response = e
+        try:
+            response.read()
+            return response.code, dict((k.lower(), v) for k, v in
+                                       response.info().items())
+        finally:
+            response.close()
+
+
+class LoadTest(object):
+    """
+    Sends ``requests`` requests from ``threads`` threads and collects
+    ``(status, seconds)`` per endpoint in ``results``. Requests that raise
+    are recorded with the status ``FAILED`` and counted by message in
+    ``errors``.
+    """
+
+    def __init__(self, fetcher, mix=MIX, exponent=1.1, conditional=0.7,
+                 seed=None):
+        self.fetcher = fetcher
+        self.rng = random.Random(seed)
+        shows = list(Show.objects.values_list('slug', flat=True))
+        if not shows:
+            raise ValueError('There are no shows to request.')
+        self.rng.shuffle(shows)
+        self.shows = zipf_choice(shows, exponent)
+        self.episodes = {}
+        for show, episode in Episode.objects.published().values_list(
+                'show__slug', 'slug'):
+            self.episodes.setdefault(show, []).append(episode)
+        self.endpoints = WeightedChoice([name for name, weight in mix],
+                                        [weight for name, weight in mix])
+        self.conditional = conditional
+        # ETags seen per path, shared by all simulated clients
+        self.etags = {}
+        self.results = {}
+        # Number of requests per error message
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def path(self, rng, endpoint):
+        if endpoint == 'podcast_shows':
+            return reverse(endpoint)
+        show = self.shows.pick(rng)
+        if endpoint == 'podcast_episode':
+            episodes = self.episodes.get(show)
+            if not episodes:
+                return reverse('podcast_episodes', kwargs={'slug': show})
+            return reverse(endpoint, kwargs={'show_slug': show,
+                'episode_slug': rng.choice(episodes)})
+        return reverse(endpoint, kwargs={'slug': show})
+
+    def request(self, rng):
+        endpoint = self.endpoints.pick(rng)
+        path = self.path(rng, endpoint)
+        headers = {'Accept-Encoding': 'gzip',
+                   'User-Agent': 'podcast_loadtest'}
+        etag = self.etags.get(path)
+        if etag and rng.random() < self.conditional:
+            headers['If-None-Match'] = etag
+        start = time.time()
+        try:
+            status, response_headers = self.fetcher(path, headers)
+        except Exception as e:
+            # A view error or a lost connection counts against the
+            # endpoint instead of ending the simulated client.
+            return endpoint, FAILED, time.time() - start, '%s: %s' % (
+                e.__class__.__name__, e)
+        elapsed = time.time() - start
+        if 'etag' in response_headers:
+            self.etags[path] = response_headers['etag']
+        return endpoint, status, elapsed, None
+
+    def _work(self, count, seed):
+        rng = random.Random(seed)
+        results = []
+        try:
+            for i in range(count):
+                results.append(self.request(rng))
+        finally:
+            for connection in connections.all():
+                connection.close()
+            self.lock.acquire()
+            try:
+                for endpoint, status, elapsed, error in results:
+                    self.results.setdefault(endpoint, []).append(
+                        (status, elapsed))
+                    if error:
+                        self.errors[error] = self.errors.get(error, 0) + 1
+            finally:
+                self.lock.release()
+
+    def run(self, requests, threads):
+        """Runs the test and returns the elapsed wall time in seconds."""
+        workers = []
+        for i in range(threads):
+            count = requests // threads + (i < requests % threads)
+            workers.append(threading.Thread(target=self._work,
+                args=(count, self.rng.random())))
+        start = time.time()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return time.time() - start
+
+    def report(self, elapsed):
+        """Yields a line per endpoint and a total line."""
+        yield '%-18s %7s %6s %6s %6s %8s %8s %8s %8s' % ('endpoint',
+            'count', '200', '304', 'other', 'req/s', 'p50 ms', 'p95 ms',
+            'p99 ms')
+        everything = []
+        for endpoint in sorted(self.results):
+            results = self.results[endpoint]
+            everything.extend(results)
+            yield self._line(endpoint, results, elapsed)
+        yield self._line('total', everything, elapsed)
+        for error, count in sorted(self.errors.items(),
+                                   key=lambda item: -item[1]):
+            yield '%d failed: %s' % (count, error)
+
+    def summary(self, elapsed):
+        """Returns requests per second and the total p50, p95 and p99."""
+        times = sorted(seconds * 1000 for results in self.results.values()
+                       for status, seconds in results)
+        return (len(times) / elapsed, percentile(times, 0.50),
+                percentile(times, 0.95), percentile(times, 0.99))
+
+    def _line(self, name, results, elapsed):
+        statuses = [status for status, seconds in results]
+        times = sorted(seconds * 1000 for status, seconds in results)
+        ok, not_modified = statuses.count(200), statuses.count(304)
+        return '%-18s %7d %6d %6d %6d %8.1f %8.1f %8.1f %8.1f' % (name,
+            len(results), ok, not_modified,
+            len(results) - ok - not_modified, len(results) / elapsed,
+            percentile(times, 0.50), percentile(times, 0.95),
+            percentile(times, 0.99))
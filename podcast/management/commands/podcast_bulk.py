@@ -0,0 +1,65 @@
+import sys
+from optparse import make_option
+
+from django import forms
+from django.core.management.base import BaseCommand, CommandError
+
+from podcast import bulk, settings
+from podcast.models import Episode
+
+
+def _date(value):
+    try:
+        return forms.DateTimeField().clean(value)
+    except forms.ValidationError:
+        raise CommandError('Invalid date: %s' % value)
+
+
+class Command(BaseCommand):
+    args = 'publish|unpublish|block|unblock | reschedule DATE | explicit VALUE'
+    help = '''Changes the status, date, block or explicit flag of many
+              episodes at once, with one update and one notification per
+              show.'''
+    option_list = BaseCommand.option_list + (
+        make_option('--show', dest='show',
+            help='Only episodes of the show with this slug.'),
+        make_option('--status', dest='status', type='int',
+            help='Only episodes with this status (1 draft, 2 public, '
+                 '3 private).'),
+        make_option('--after', dest='after',
+            help='Only episodes dated after this date.'),
+        make_option('--before', dest='before',
+            help='Only episodes dated before this date.'),
+    )
+
+    def handle(self, *args, **options):
+        if not args:
+            raise CommandError('Usage: podcast_bulk %s' % self.args)
+        action, values = args[0], args[1:]
+        episodes = Episode.objects.all()
+        if options['show']:
+            episodes = episodes.filter(show__slug__exact=options['show'])
+        if options['status'] is not None:
+            episodes = episodes.filter(status=options['status'])
+        if options['after']:
+            episodes = episodes.filter(date__gt=_date(options['after']))
+        if options['before']:
+            episodes = episodes.filter(date__lt=_date(options['before']))
+
+        if action == 'publish':
+            count = bulk.publish(episodes)
+        elif action == 'unpublish':
+            count = bulk.unpublish(episodes)
+        elif action in ('block', 'unblock'):
+            count = bulk.set_block(episodes, action == 'block')
+        elif action == 'reschedule' and len(values) == 1:
+            count = bulk.reschedule(episodes, _date(values[0]))
+        elif action == 'explicit' and len(values) == 1:
+            choices = [value for value, label in settings.EXPLICIT_CHOICES]
+            if values[0] not in choices:
+                raise CommandError('Explicit must be one of %s.' %
+                    ', '.join(choices))
+            count = bulk.set_explicit(episodes, values[0])
+        else:
+            raise CommandError('Usage: podcast_bulk %s' % self.args)
+        sys.stdout.write('%d episodes updated.\n' % count)
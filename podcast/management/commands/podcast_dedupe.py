@@ -0,0 +1,101 @@
+import datetime
+import hashlib
+import multiprocessing
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from podcast import probe
+from podcast.blobs import ALGO, storage
+from podcast.models import Blob, Enclosure, Episode
+from podcast.signals import shows_changed
+
+# Bytes read at a time while hashing
+BLOCK_SIZE = 1024 * 1024
+
+
+def _hash(job):
+    name, path = job
+    hasher = hashlib.sha1()
+    size = 0
+    try:
+        f = open(path, 'rb')
+        try:
+            for data in iter(lambda: f.read(BLOCK_SIZE), b''):
+                hasher.update(data)
+                size += len(data)
+        finally:
+            f.close()
+    except (IOError, OSError) as e:
+        return name, None, None, str(e)
+    return name, hasher.hexdigest(), size, None
+
+
+class Command(BaseCommand):
+    help = '''Hashes the enclosure files stored before content-addressed
+              storage, points enclosures with identical files at one copy
+              and deletes the others.'''
+    option_list = BaseCommand.option_list + (
+        make_option('--processes', dest='processes', type='int',
+            default=multiprocessing.cpu_count(),
+            help='Number of files hashed in parallel.'),
+        make_option('--dry-run', action='store_true', dest='dry_run',
+            default=False, help='Report without changing anything.'),
+    )
+
+    def handle(self, *args, **options):
+        names = set(Enclosure.objects.exclude(Q(file='') | Q(file=None)
+            ).values_list('file', flat=True))
+        names.difference_update(Blob.objects.filter(name__in=names
+            ).values_list('name', flat=True))
+        jobs = []
+        for enclosure in Enclosure.objects.filter(file__in=names):
+            path = probe.local_path(enclosure)
+            if path is not None and enclosure.file.name in names:
+                jobs.append((enclosure.file.name, path))
+                names.discard(enclosure.file.name)
+        pool = multiprocessing.Pool(options['processes'])
+        seen = set()
+        changed = {}
+        folded = reclaimed = 0
+        try:
+            for name, digest, size, error in pool.imap_unordered(_hash, jobs):
+                if error:
+                    sys.stderr.write('%s: %s\n' % (name, error))
+                    continue
+                if options['dry_run']:
+                    if digest in seen or Blob.objects.filter(
+                            hash=digest).exists():
+                        folded += 1
+                        reclaimed += size
+                    seen.add(digest)
+                    continue
+                # The first copy found becomes the blob, so its URL stays.
+                blob, created = Blob.objects.get_or_create(hash=digest,
+                    defaults={'name': name, 'size': size})
+                enclosures = Enclosure.objects.filter(file=name)
+                refs = enclosures.count()
+                if created:
+                    enclosures.filter(hash='').update(algo=ALGO, hash=digest)
+                else:
+                    for enclosure in enclosures.select_related(
+                            'episode__show'):
+                        show = enclosure.episode.show
+                        changed[show.pk] = show
+                    Episode.objects.filter(enclosure__file=name).update(
+                        update=datetime.datetime.now())
+                    enclosures.update(file=blob.name, algo=ALGO, hash=digest)
+                    storage.inner.delete(name)
+                    folded += 1
+                    reclaimed += size
+                Blob.objects.filter(pk=blob.pk).update(refs=F('refs') + refs)
+        finally:
+            pool.close()
+            pool.join()
+        if changed:
+            shows_changed.send(sender=Enclosure, shows=changed.values())
+        sys.stdout.write('Hashed %d files, %s %d copies, %d bytes.\n' % (
+            len(jobs), options['dry_run'] and 'would fold' or 'folded',
+            folded, reclaimed))
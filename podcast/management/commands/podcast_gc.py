@@ -0,0 +1,47 @@
+import datetime
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from podcast import settings
+from podcast.blobs import storage
+from podcast.models import Blob, Enclosure, Upload
+
+
+class Command(BaseCommand):
+    help = '''Deletes stored enclosure files that no enclosure or finished
+              upload refers to and corrects the reference counts of the
+              others.'''
+    option_list = BaseCommand.option_list + (
+        make_option('--grace', dest='grace', type='int',
+            default=settings.BLOB_GRACE,
+            help='Keep unreferenced files younger than this many seconds.'),
+        make_option('--dry-run', action='store_true', dest='dry_run',
+            default=False, help='Report without deleting anything.'),
+    )
+
+    def handle(self, *args, **options):
+        cutoff = datetime.datetime.now() - datetime.timedelta(
+            seconds=options['grace'])
+        deleted = reclaimed = repaired = 0
+        # Finished uploads wait for their enclosure to be saved.
+        for blob in Blob.objects.filter(refs__lte=0, used__lt=cutoff).exclude(
+                name__in=Upload.objects.exclude(name='').values('name')):
+            # The count is only a hint; check before deleting.
+            refs = Enclosure.objects.filter(file=blob.name).count()
+            if refs:
+                if not options['dry_run']:
+                    Blob.objects.filter(pk=blob.pk).update(refs=refs)
+                repaired += 1
+                continue
+            sys.stdout.write('%s (%d bytes)\n' % (blob.name, blob.size))
+            if not options['dry_run']:
+                if storage.inner.exists(blob.name):
+                    storage.inner.delete(blob.name)
+                blob.delete()
+            deleted += 1
+            reclaimed += blob.size
+        sys.stdout.write('%s %d files, %d bytes; %d counts repaired.\n' % (
+            options['dry_run'] and 'Would delete' or 'Deleted', deleted,
+            reclaimed, repaired))
@@ -0,0 +1,91 @@
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from podcast import loadtest
+
+
+class Command(BaseCommand):
+    help = '''Simulates podcatchers polling the feeds, sitemaps and pages of
+              the shows in the database and reports throughput and latency
+              percentiles per endpoint. Requests go to the WSGI handler in
+              this process unless --url is given.'''
+    option_list = BaseCommand.option_list + (
+        make_option('--requests', dest='requests', type='int', default=1000,
+            help='Total number of requests.'),
+        make_option('--threads', dest='threads', type='int', default=8,
+            help='Number of simulated clients sending at once.'),
+        make_option('--zipf', dest='zipf', type='float', default=1.1,
+            help='Exponent of the show popularity; higher is more skewed.'),
+        make_option('--conditional', dest='conditional', type='float',
+            default=0.7,
+            help='Share of repeat requests sent with If-None-Match.'),
+        make_option('--mix', dest='mix',
+            help='Endpoint weights, e.g. "podcast_feed=80,podcast_atom=20".'),
+        make_option('--seed', dest='seed', type='int',
+            help='Random seed, to repeat a run.'),
+        make_option('--url', dest='url',
+            help='Base URL of a running server, e.g. http://127.0.0.1:8000'),
+        make_option('--sweep', dest='sweep',
+            help='Repeat the run at these numbers of threads, e.g. '
+                 '"8,64", and compare the totals with a serial run.'),
+        make_option('--baseline', action='store_true', dest='baseline',
+            default=False,
+            help='Also send the requests one at a time and compare the '
+                 'totals.'),
+    )
+
+    def handle(self, *args, **options):
+        if options['url']:
+            fetcher = loadtest.HTTPFetcher(options['url'])
+        else:
+            fetcher = loadtest.WSGIFetcher()
+        mix = loadtest.MIX
+        if options['mix']:
+            try:
+                mix = loadtest.parse_mix(options['mix'])
+            except ValueError:
+                raise CommandError('Invalid mix: %s' % options['mix'])
+        if options['sweep']:
+            try:
+                levels = [int(level) for level in
+                          options['sweep'].split(',')]
+            except ValueError:
+                raise CommandError('Invalid sweep: %s' % options['sweep'])
+            self.compare(fetcher, mix, levels, options)
+            return
+        if options['baseline']:
+            self.compare(fetcher, mix, [options['threads']], options)
+            return
+        test = self.load_test(fetcher, mix, options)
+        elapsed = test.run(options['requests'], options['threads'])
+        for line in test.report(elapsed):
+            sys.stdout.write(line + '\n')
+        sys.stdout.write('%d requests in %.1f s\n' % (options['requests'],
+            elapsed))
+
+    def compare(self, fetcher, mix, levels, options):
+        """
+        Sends the same load serially and then at each number of threads in
+        ``levels``, and prints the totals with the speedup over the serial
+        run.
+        """
+        sys.stdout.write('%8s %8s %8s %8s %8s %8s\n' % ('threads', 'req/s',
+            'p50 ms', 'p95 ms', 'p99 ms', 'speedup'))
+        serial = None
+        for threads in [1] + [level for level in levels if level != 1]:
+            test = self.load_test(fetcher, mix, options)
+            elapsed = test.run(options['requests'], threads)
+            summary = test.summary(elapsed)
+            if serial is None:
+                serial = summary[0]
+            sys.stdout.write('%8d %8.1f %8.1f %8.1f %8.1f %7.1fx\n' % (
+                (threads,) + summary + (serial and summary[0] / serial,)))
+
+    def load_test(self, fetcher, mix, options):
+        try:
+            return loadtest.LoadTest(fetcher, mix, options['zipf'],
+                options['conditional'], options['seed'])
+        except ValueError as e:
+            raise CommandError(str(e))
@@ -0,0 +1,78 @@
+import sys
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models
+
+from podcast.managers import EPISODE_LIST_FIELDS, EPISODE_SITEMAP_FIELDS, \
+    EPISODE_FEED_FIELDS, EPISODE_ATOM_FIELDS, EPISODE_MEDIA_DEFERRED, \
+    SHOW_LIST_FIELDS
+from podcast.models import Episode, Show
+
+
+def instance_size(obj):
+    """
+    Approximate memory held by a model instance: the object, its attribute
+    dictionary, the attribute values and any related instances cached by
+    ``select_related``.
+    """
+    size = sys.getsizeof(obj) + sys.getsizeof(obj.__dict__)
+    for value in obj.__dict__.values():
+        if isinstance(value, models.Model):
+            size += instance_size(value)
+        else:
+            size += sys.getsizeof(value)
+    return size
+
+
+def measure(queryset):
+    """Returns rows, bytes per row and seconds to load ``queryset``."""
+    start = time.time()
+    objects = list(queryset)
+    elapsed = time.time() - start
+    if not objects:
+        return 0, 0, elapsed
+    total = sum(instance_size(obj) for obj in objects)
+    return len(objects), total // len(objects), elapsed
+
+
+class Command(BaseCommand):
+    help = '''Compares the memory per loaded row of the column projections
+              used by the views with loading every column.'''
+    option_list = BaseCommand.option_list + (
+        make_option('--show', dest='show',
+            help='Only measure the episodes of the show with this slug.'),
+    )
+
+    def handle(self, *args, **options):
+        episodes = Episode.objects.published()
+        shows = Show.objects.all()
+        if options['show']:
+            episodes = episodes.filter(show__slug__exact=options['show'])
+            shows = shows.filter(slug__exact=options['show'])
+        with_show = episodes.select_related('show')
+        views = (
+            ('episode_list', with_show,
+                with_show.only(*EPISODE_LIST_FIELDS)),
+            ('episode_sitemap', with_show,
+                with_show.only(*EPISODE_SITEMAP_FIELDS)),
+            ('show_list_feed', episodes,
+                episodes.only(*EPISODE_FEED_FIELDS)),
+            ('show_list_atom', episodes,
+                episodes.only(*EPISODE_ATOM_FIELDS)),
+            ('show_list_media', with_show,
+                with_show.defer(*EPISODE_MEDIA_DEFERRED)),
+            ('show_list', shows, shows.only(*SHOW_LIST_FIELDS)),
+        )
+        if not episodes.exists():
+            raise CommandError('There are no published episodes to load.')
+        sys.stdout.write('%-16s %6s %12s %12s %8s %10s %10s\n' % ('view',
+            'rows', 'bytes/row', 'projected', 'saved', 'ms', 'ms proj.'))
+        for name, full, projected in views:
+            rows, full_size, full_time = measure(full)
+            rows, size, elapsed = measure(projected)
+            saved = full_size and 100.0 * (full_size - size) / full_size
+            sys.stdout.write('%-16s %6d %12d %12d %7.1f%% %10.1f %10.1f\n' % (
+                name, rows, full_size, size, saved, full_time * 1000,
+                elapsed * 1000))
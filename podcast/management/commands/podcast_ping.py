@@ -0,0 +1,29 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from podcast import settings, websub
+from podcast.models import Show
+
+
+class Command(BaseCommand):
+    help = '''Pings the configured WebSub hubs for the given shows (all shows 
+              if none are given) right away.'''
+    args = '[slug ...]'
+
+    def handle(self, *slugs, **options):
+        if not settings.WEBSUB_HUBS:
+            raise CommandError('PODCAST_WEBSUB_HUBS is empty.')
+        shows = Show.objects.all()
+        if slugs:
+            shows = shows.filter(slug__in=slugs)
+        topics = []
+        for show in shows:
+            topics.extend(websub.topic_url(view_name, show.slug) 
+                          for view_name in websub.FEEDS)
+        for hub in settings.WEBSUB_HUBS:
+            try:
+                websub.ping_hub(hub, topics)
+            except IOError as e:
+                raise CommandError('Pinging %s failed: %s' % (hub, e))
+            sys.stdout.write('Pinged %s with %d topics.\n' % (hub, len(topics)))
@@ -0,0 +1,72 @@
+import datetime
+import multiprocessing
+import os
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from podcast import probe
+from podcast.models import Enclosure, Episode
+from podcast.signals import shows_changed
+
+
+def _probe(job):
+    pk, path, mime = job
+    try:
+        return pk, probe.probe(path, mime), os.path.getsize(path), None
+    except (IOError, OSError, ValueError) as e:
+        return pk, None, None, str(e)
+
+
+class Command(BaseCommand):
+    help = '''Reads bit rate, frame rate, sample rate, channels and 
+              dimensions from the headers of enclosure files and fills in 
+              the blank fields and missing file sizes.'''
+    option_list = BaseCommand.option_list + (
+        make_option('--processes', dest='processes', type='int', 
+            default=multiprocessing.cpu_count(), 
+            help='Number of files probed in parallel.'),
+        make_option('--force', action='store_true', dest='force', 
+            default=False, help='Overwrite fields that are filled in.'),
+    )
+
+    def handle(self, *args, **options):
+        enclosures = dict((e.pk, e) for e in Enclosure.objects.exclude(
+            file='').exclude(file=None).select_related('episode__show'))
+        jobs = []
+        for enclosure in enclosures.values():
+            path = probe.local_path(enclosure)
+            if path is not None:
+                jobs.append((enclosure.pk, path, enclosure.mime))
+        pool = multiprocessing.Pool(options['processes'])
+        changed = {}
+        touched = set()
+        updated = 0
+        try:
+            for pk, info, size, error in pool.imap_unordered(_probe, jobs):
+                enclosure = enclosures[pk]
+                if error:
+                    sys.stderr.write('%s: %s\n' % (enclosure.file.name, error))
+                    continue
+                values = probe.enclosure_values(enclosure, info, 
+                    options['force'])
+                if enclosure.size is None:
+                    values['size'] = size
+                if not values:
+                    continue
+                Enclosure.objects.filter(pk=pk).update(**values)
+                updated += 1
+                touched.add(enclosure.episode_id)
+                show = enclosure.episode.show
+                changed[show.pk] = show
+        finally:
+            pool.close()
+            pool.join()
+        if changed:
+            # Expires the episodes' cached fragments, as saving would.
+            Episode.objects.filter(pk__in=touched).update(
+                update=datetime.datetime.now())
+            shows_changed.send(sender=Enclosure, shows=changed.values())
+        sys.stdout.write('Probed %d files, updated %d enclosures.\n' % (
+            len(jobs), updated))
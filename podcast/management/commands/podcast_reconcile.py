@@ -0,0 +1,35 @@
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from podcast.models import Show
+from podcast.signals import shows_changed
+
+
+class Command(BaseCommand):
+    help = '''Recomputes the published episode aggregates of every show and 
+              repairs the ones that have drifted, e.g. after episodes 
+              scheduled for the future went live.'''
+    option_list = BaseCommand.option_list + (
+        make_option('--dry-run', action='store_true', dest='dry_run', 
+            default=False, help='Report drift without repairing it.'),
+    )
+
+    def handle(self, *args, **options):
+        drifted = []
+        for show in Show.objects.all():
+            values = show.aggregates()
+            drift = [name for name, value in sorted(values.items()) 
+                     if getattr(show, name) != value]
+            if not drift:
+                continue
+            sys.stdout.write('%s: %s\n' % (show.slug, ', '.join(drift)))
+            drifted.append(show)
+        if options['dry_run']:
+            sys.stdout.write('%d shows have drifted.\n' % len(drifted))
+            return
+        if drifted:
+            # Receivers store the aggregates and refresh the feeds.
+            shows_changed.send(sender=Show, shows=drifted)
+        sys.stdout.write('%d shows repaired.\n' % len(drifted))
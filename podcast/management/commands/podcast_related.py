@@ -0,0 +1,24 @@
+import sys
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from podcast import related, settings
+
+
+class Command(BaseCommand):
+    help = '''Recomputes the related episodes of every published episode
+              from their keywords and categories.'''
+    option_list = BaseCommand.option_list + (
+        make_option('--count', dest='count', type='int',
+            default=settings.RELATED_EPISODES,
+            help='Related episodes to keep per episode.'),
+    )
+
+    def handle(self, *args, **options):
+        start = time.time()
+        rows = related.build(options['count'])
+        sys.stdout.write('%d related episodes stored in %.1f s (%s).\n' % (
+            rows, time.time() - start,
+            related.numpy is None and 'inverted index' or 'NumPy'))
@@ -0,0 +1,37 @@
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from podcast import renditions
+from podcast.models import Episode, Show
+from podcast.signals import shows_changed
+
+
+class Command(BaseCommand):
+    help = '''Makes the renditions of show and episode images that do not 
+              have them yet.'''
+    option_list = BaseCommand.option_list + (
+        make_option('--force', action='store_true', dest='force', 
+            default=False, help='Remake existing renditions too.'),
+    )
+
+    def handle(self, *args, **options):
+        changed = {}
+        made = 0
+        for model in (Show, Episode):
+            for instance in model.objects.exclude(image=''):
+                if not options['force'] and \
+                        renditions.has_renditions(instance.image):
+                    continue
+                try:
+                    renditions.generate(instance.image)
+                except (IOError, ValueError) as e:
+                    sys.stderr.write('%s: %s\n' % (instance.image.name, e))
+                    continue
+                made += 1
+                show = getattr(instance, 'show', instance)
+                changed[show.pk] = show
+        if changed:
+            shows_changed.send(sender=Show, shows=changed.values())
+        sys.stdout.write('Made renditions of %d images.\n' % made)
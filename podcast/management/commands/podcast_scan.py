@@ -0,0 +1,96 @@
+import datetime
+import sys
+from multiprocessing.pool import ThreadPool
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from podcast import scan, settings
+from podcast.models import Enclosure, EnclosureHealth, Episode
+from podcast.signals import shows_changed
+
+
+class Command(BaseCommand):
+    help = '''Checks that every enclosure has a file or player, that its
+              file exists and still has the recorded size and hash, and
+              that every published episode has an enclosure. Records the
+              results, which feeds use to leave out broken enclosures.'''
+    option_list = BaseCommand.option_list + (
+        make_option('--threads', dest='threads', type='int',
+            default=settings.SCAN_THREADS,
+            help='Number of files checked at once.'),
+        make_option('--no-hash', action='store_false', dest='hashes',
+            default=True, help='Check sizes only, without reading files.'),
+        make_option('--repair', action='store_true', dest='repair',
+            default=False,
+            help='Record the actual size of files whose size differs.'),
+        make_option('--show', dest='show',
+            help='Only check the episodes of the show with this slug.'),
+    )
+
+    def handle(self, *args, **options):
+        enclosures = Enclosure.objects.select_related('episode__show')
+        if options['show']:
+            enclosures = enclosures.filter(episode__show__slug=options['show'])
+        before = dict(EnclosureHealth.objects.filter(enclosure__in=enclosures
+            ).values_list('enclosure', 'status'))
+        hashes = options['hashes']
+
+        def job(enclosure):
+            return enclosure, scan.check(enclosure, hashes)
+
+        # Queried here, as the pool's threads must not use the database.
+        jobs = list(enclosures)
+        pool = ThreadPool(max(1, options['threads']))
+        changed = {}
+        touched = set()
+        counts = {}
+        try:
+            for enclosure, (status, detail, size) in pool.imap_unordered(
+                    job, jobs):
+                if status == 'size' and options['repair']:
+                    Enclosure.objects.filter(pk=enclosure.pk).update(
+                        size=size)
+                    status, detail = 'ok', 'size repaired'
+                    touched.add(enclosure.episode_id)
+                elif enclosure.size is None and size is not None:
+                    # Enclosures saved before sizes were recorded
+                    Enclosure.objects.filter(pk=enclosure.pk).update(
+                        size=size)
+                    touched.add(enclosure.episode_id)
+                values = {'status': status, 'detail': detail,
+                          'checked': datetime.datetime.now()}
+                if not EnclosureHealth.objects.filter(
+                        enclosure=enclosure).update(**values):
+                    EnclosureHealth.objects.create(enclosure=enclosure,
+                        **values)
+                if (status in settings.BROKEN_HEALTH) != (before.get(
+                        enclosure.pk) in settings.BROKEN_HEALTH):
+                    touched.add(enclosure.episode_id)
+                if enclosure.episode_id in touched:
+                    changed[enclosure.episode.show.pk] = enclosure.episode.show
+                counts[status] = counts.get(status, 0) + 1
+                if status != 'ok':
+                    sys.stdout.write('%s: %s %s\n' % (enclosure.file or
+                        enclosure.pk, status, detail))
+        finally:
+            pool.close()
+            pool.join()
+        if changed:
+            # Feed items and cached fragments follow the episode's update.
+            Episode.objects.filter(pk__in=touched).update(
+                update=datetime.datetime.now())
+            shows_changed.send(sender=Enclosure, shows=changed.values())
+        episodes = Episode.objects.published().exclude(
+            pk__in=Enclosure.objects.exclude(
+                health__status__in=settings.BROKEN_HEALTH
+            ).values('episode'))
+        if options['show']:
+            episodes = episodes.filter(show__slug=options['show'])
+        for episode in episodes.select_related('show'):
+            sys.stdout.write('%s/%s: no enclosure\n' % (episode.show.slug,
+                episode.slug))
+        sys.stdout.write('Checked %d enclosures: %s.\n' % (
+            sum(counts.values()), ', '.join('%d %s' % (counts[status],
+            status) for status, label in settings.HEALTH_CHOICES
+            if status in counts) or 'none'))
@@ -1,6 +1,26 @@
 from django.db.models import Manager
 import datetime
 
+# Columns rendered by each view. Everything else is deferred, so these must
+# list every field the respective template touches or each episode costs
+# an extra query.
+EPISODE_LIST_FIELDS = ('show', 'slug', 'date', 'update', 'title', 'subtitle', 
+    'image', 'summary', 'description')
+EPISODE_SITEMAP_FIELDS = ('show', 'slug', 'date', 'update', 'frequency', 
+    'priority', 'title', 'image', 'summary', 'description', 'explicit', 
+    'minutes', 'seconds')
+EPISODE_FEED_FIELDS = ('slug', 'date', 'title', 'description', 'category', 
+    'domain', 'subtitle', 'summary', 'minutes', 'seconds', 'keywords', 
+    'explicit', 'block')
+EPISODE_ATOM_FIELDS = ('slug', 'date', 'title', 'summary', 'description')
+EPISODE_RELATED_FIELDS = ('show', 'slug', 'date', 'title')
+# The Media RSS feed renders nearly everything, so it names what to skip.
+EPISODE_MEDIA_DEFERRED = ('captions', 'category', 'domain', 'frequency', 
+    'priority', 'status', 'update', 'subtitle', 'summary', 'minutes', 
+    'seconds', 'explicit', 'block')
+SHOW_LIST_FIELDS = ('organization', 'slug', 'title', 'image', 'summary', 
+    'description', 'episode_count', 'latest_date', 'total_seconds')
+
 
 class EpisodeManager(Manager):
     """Returns public posts that are not in the future."""
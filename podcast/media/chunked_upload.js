@@ -0,0 +1,137 @@
+/*
+ * Resumable, chunked enclosure uploads for the podcast admin.
+ *
+ * Sends the chosen file in chunks, each with a SHA-256 digest, resumes from
+ * the server's offset after errors and fills the hidden input of the
+ * "Large file" field with the upload token once the server has assembled
+ * the file. See podcast/uploads.py for the protocol.
+ */
+(function () {
+    var RETRY_DELAY = 3000;
+
+    function csrfToken() {
+        var input = document.querySelector('input[name=csrfmiddlewaretoken]');
+        if (input) {
+            return input.value;
+        }
+        var match = document.cookie.match(/(?:^|; )csrftoken=([^;]*)/);
+        return match ? decodeURIComponent(match[1]) : '';
+    }
+
+    function request(method, url, body, headers, done) {
+        var xhr = new XMLHttpRequest();
+        xhr.open(method, url);
+        xhr.setRequestHeader('X-CSRFToken', csrfToken());
+        for (var name in headers) {
+            xhr.setRequestHeader(name, headers[name]);
+        }
+        xhr.onload = function () {
+            var data = null;
+            try {
+                data = JSON.parse(xhr.responseText);
+            } catch (e) {}
+            done(xhr.status, data);
+        };
+        xhr.onerror = function () {
+            done(0, null);
+        };
+        xhr.send(body);
+    }
+
+    function base64(buffer) {
+        var bytes = new Uint8Array(buffer), text = '';
+        for (var i = 0; i < bytes.length; i++) {
+            text += String.fromCharCode(bytes[i]);
+        }
+        return window.btoa(text);
+    }
+
+    function Upload(input) {
+        this.input = input;
+        this.file = input.files[0];
+        this.target = document.getElementById(input.getAttribute('data-target'));
+        this.status = input.parentNode.querySelector('.podcast-chunked-upload-status');
+        this.url = input.getAttribute('data-url');
+        this.target.value = '';
+    }
+
+    Upload.prototype.report = function (text) {
+        this.status.textContent = text;
+    };
+
+    Upload.prototype.start = function () {
+        var self = this, body = new FormData();
+        body.append('filename', this.file.name);
+        body.append('size', this.file.size);
+        body.append('csrfmiddlewaretoken', csrfToken());
+        this.report('Starting upload...');
+        request('POST', this.url, body, {}, function (status, data) {
+            if (status !== 201) {
+                self.report('Could not start the upload (' + status + ').');
+                return;
+            }
+            self.token = data.token;
+            self.chunkUrl = self.url + data.token + '/';
+            self.chunkSize = data.chunk_size;
+            self.send(data.offset);
+        });
+    };
+
+    Upload.prototype.resume = function () {
+        var self = this;
+        request('GET', this.chunkUrl, null, {}, function (status, data) {
+            if (status === 200) {
+                self.send(data.offset, data.complete);
+            } else if (status === 404) {
+                self.report('The upload expired, please choose the file again.');
+            } else {
+                self.retry();
+            }
+        });
+    };
+
+    Upload.prototype.retry = function () {
+        var self = this;
+        this.report('Connection lost, retrying...');
+        window.setTimeout(function () { self.resume(); }, RETRY_DELAY);
+    };
+
+    Upload.prototype.send = function (offset, complete) {
+        var self = this, size = this.file.size;
+        if (complete) {
+            this.target.value = this.token;
+            this.report('Upload complete. Save to attach it.');
+            return;
+        }
+        if (offset >= size) {
+            this.report('Assembling the file...');
+            window.setTimeout(function () { self.resume(); }, RETRY_DELAY);
+            return;
+        }
+        var end = Math.min(offset + this.chunkSize, size);
+        var chunk = this.file.slice(offset, end);
+        this.report(Math.floor(100 * offset / size) + '% uploaded');
+        chunk.arrayBuffer().then(function (buffer) {
+            return window.crypto.subtle.digest('SHA-256', buffer).then(function (digest) {
+                request('PUT', self.chunkUrl, buffer, {
+                    'Content-Type': 'application/octet-stream',
+                    'Content-Range': 'bytes ' + offset + '-' + (end - 1) + '/' + size,
+                    'Digest': 'SHA-256=' + base64(digest)
+                }, function (status, data) {
+                    if (status === 200 || status === 409) {
+                        self.send(data.offset, data.complete);
+                    } else {
+                        self.retry();
+                    }
+                });
+            });
+        });
+    };
+
+    document.addEventListener('change', function (event) {
+        var input = event.target;
+        if (input.className === 'podcast-chunked-upload' && input.files.length) {
+            new Upload(input).start();
+        }
+    });
+})();
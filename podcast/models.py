@@ -1,7 +1,8 @@
 from django.db import models
+from django.db.models import Count, Max
 from django.contrib.auth.models import User
 from podcast.managers import EpisodeManager
-from podcast import settings
+from podcast import blobs, settings
 
 class ParentCategory(models.Model):
     """Parent Category model."""
@@ -53,6 +54,16 @@ class ChildCategory(models.Model):
             return u'%s' % (self.parent)
 
 
+def cadence(dates):
+    """The median seconds between ``dates``, or ``None`` for fewer than two."""
+    dates = sorted(dates)
+    gaps = sorted((later - earlier).days * 86400 + (later - earlier).seconds 
+                  for earlier, later in zip(dates, dates[1:]))
+    if not gaps:
+        return None
+    return gaps[len(gaps) // 2]
+
+
 class Show(models.Model):
     """Show model."""
     # RSS 2.0
@@ -149,6 +160,15 @@ class Show(models.Model):
                      WebObjects/MZStore.woa/wa/viewPodcast?id=000000000". 
                      See <a href="http://code.google.com/p/django-podcast/">
                      documentation</a> for more.''')
+    # Published episode aggregates, kept current by podcast.signals
+    episode_count = models.PositiveIntegerField(default=0, editable=False)
+    latest_date = models.DateTimeField(blank=True, null=True, editable=False)
+    latest_update = models.DateTimeField(blank=True, null=True, 
+        editable=False)
+    total_seconds = models.PositiveIntegerField(default=0, editable=False)
+    # Typical seconds between published episodes
+    cadence = models.PositiveIntegerField(blank=True, null=True, 
+        editable=False)
 
     class Meta:
         ordering = ['organization', 'slug']
@@ -160,6 +180,54 @@ class Show(models.Model):
     def get_absolute_url(self):
         return ('podcast_episodes', (), {'slug': self.slug})
 
+    def aggregates(self):
+        """Computes the published episode aggregates from the episodes."""
+        published = Episode.objects.published().filter(show=self)
+        values = published.aggregate(episode_count=Count('id'), 
+            latest_date=Max('date'), latest_update=Max('update'))
+        values['total_seconds'] = 0
+        for minutes, seconds in published.values_list('minutes', 'seconds'):
+            try:
+                values['total_seconds'] += int(minutes or 0) * 60 + \
+                    int(seconds or 0)
+            except ValueError:
+                pass
+        values['cadence'] = cadence(published.order_by('-date').values_list(
+            'date', flat=True)[:settings.CADENCE_EPISODES])
+        return values
+
+    def update_aggregates(self):
+        """
+        Stores fresh aggregates without sending any save signals. Returns 
+        ``True`` if they had drifted.
+        """
+        values = self.aggregates()
+        changed = False
+        for name, value in values.items():
+            if getattr(self, name) != value:
+                setattr(self, name, value)
+                changed = True
+        if changed:
+            Show.objects.filter(pk=self.pk).update(**values)
+        return changed
+
+    def duration(self):
+        """Total running time of the published episodes as H:MM:SS."""
+        minutes, seconds = divmod(self.total_seconds, 60)
+        return u'%d:%02d:%02d' % (minutes // 60, minutes % 60, seconds)
+
+    def feed_ttl(self):
+        """
+        Minutes the feed may be cached: the TTL set for the show, or else a 
+        fraction of the time between its episodes.
+        """
+        if self.ttl:
+            return self.ttl
+        if not self.cadence:
+            return settings.TTL_MIN
+        return max(settings.TTL_MIN, min(settings.TTL_MAX, 
+            self.cadence // 60 // settings.TTL_FRACTION))
+
 
 class MediaCategory(models.Model):
     """Category model for Media RSS"""
@@ -221,8 +289,8 @@ class Episode(models.Model):
         help_text='''The relative priority of this episode compared to 
                      others. 1.0 is the most important. For sitemaps.''')
     status = models.IntegerField(choices=settings.STATUS_CHOICES, default=2)
-    date = models.DateTimeField(auto_now_add=True)
-    update = models.DateTimeField(auto_now=True)
+    date = models.DateTimeField(auto_now_add=True, db_index=True)
+    update = models.DateTimeField(auto_now=True, db_index=True)
     # iTunes
     subtitle = models.CharField(max_length=255, blank=True, 
         help_text='Looks best if only a few words like a tagline.')
@@ -325,6 +393,11 @@ class Episode(models.Model):
                 {'show_slug': self.show.slug, 
                  'episode_slug': self.slug})
 
+    def healthy_enclosures(self):
+        """Enclosures the last scan did not find broken."""
+        return self.enclosure_set.exclude(
+            health__status__in=settings.BROKEN_HEALTH)
+
     def seconds_total(self):
         try:
             return (((float(self.minutes)) * 60) + (float(self.seconds)))
@@ -338,7 +411,7 @@ class Enclosure(models.Model):
         help_text='''Title is generally only useful with multiple 
                      enclosures.''')
     file = models.FileField(upload_to='podcasts/episodes/files/', 
-        blank=True, null=True, 
+        storage=blobs.storage, blank=True, null=True, 
         help_text='''Either upload or use the "Player" text box below. 
                      If uploading, file must be less than or equal to 30 MB 
                      for a Google video sitemap.''')
@@ -384,9 +457,178 @@ class Enclosure(models.Model):
                      Flash Video set of video files. Note that the iTunes 
                      feed only accepts the first file. More uploading is 
                      available after clicking "Save and continue editing."''')
+    size = models.BigIntegerField(blank=True, null=True, editable=False, 
+        help_text='File size in bytes, recorded when the file is uploaded.')
 
     class Meta:
         ordering = ['mime', 'file']
 
     def __unicode__(self):
         return u'%s' % (self.file)
+
+    def file_size(self):
+        """
+        The recorded size of the file, else its size in the storage, or 
+        ``None`` if it cannot be read.
+        """
+        if self.size is None and self.file:
+            try:
+                return self.file.size
+            except (IOError, OSError):
+                return None
+        return self.size
+
+
+
+class Upload(models.Model):
+    """A resumable upload of an enclosure file, received in chunks."""
+    token = models.CharField(max_length=32, unique=True)
+    user = models.ForeignKey(User)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)
+    chunks = models.PositiveIntegerField(default=0)
+    mime = models.CharField(max_length=255, blank=True)
+    # Set once the chunks are assembled into the final file
+    name = models.CharField(max_length=255, blank=True)
+    algo = models.CharField(max_length=50, blank=True, 
+        choices=settings.ALGO_CHOICES)
+    hash = models.CharField(max_length=255, blank=True)
+    # When a worker started assembling the chunks
+    claimed = models.DateTimeField(blank=True, null=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created']
+
+    def __unicode__(self):
+        return u'%s' % (self.filename)
+
+    def complete(self):
+        return bool(self.name)
+
+
+
+class Blob(models.Model):
+    """
+    A file stored by ``podcast.blobs.BlobStorage`` under the hash of its 
+    content, with the number of enclosures using it.
+    """
+    hash = models.CharField(max_length=40, unique=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField()
+    refs = models.IntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    # Last time the file was stored again or an enclosure let go of it
+    used = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['-created']
+
+    def __unicode__(self):
+        return u'%s' % (self.name)
+
+
+class Rendition(models.Model):
+    """
+    A resized copy of a show or episode image, stored under the hash of its 
+    content. The "original" rendition only records the size of the source.
+    """
+    source = models.CharField(max_length=255, db_index=True)
+    spec = models.CharField(max_length=50)
+    file = models.FileField(upload_to='podcasts/renditions/', max_length=255)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('source', 'spec')
+
+    def __unicode__(self):
+        return u'%s (%s)' % (self.source, self.spec)
+
+
+class RelatedEpisode(models.Model):
+    """
+    One of the most similar episodes to an episode, precomputed by 
+    ``podcast.related`` from keywords and categories.
+    """
+    episode = models.ForeignKey(Episode, related_name='related_episodes')
+    related = models.ForeignKey(Episode, related_name='related_by')
+    rank = models.PositiveIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['episode', 'rank']
+        unique_together = ('episode', 'rank')
+
+    def __unicode__(self):
+        return u'%s: %s' % (self.episode, self.related)
+
+
+class EpisodeTerm(models.Model):
+    """
+    A term describing a public episode, kept by ``podcast.related`` to 
+    update related episodes without reading every episode.
+    """
+    episode = models.ForeignKey(Episode, related_name='terms')
+    term = models.CharField(max_length=255, db_index=True)
+
+    class Meta:
+        unique_together = ('episode', 'term')
+
+    def __unicode__(self):
+        return u'%s: %s' % (self.episode, self.term)
+
+
+class EnclosureHealth(models.Model):
+    """The result of the last check of an enclosure by ``podcast_scan``."""
+    enclosure = models.OneToOneField(Enclosure, related_name='health')
+    status = models.CharField(max_length=10, db_index=True, 
+        choices=settings.HEALTH_CHOICES)
+    detail = models.CharField(max_length=255, blank=True)
+    checked = models.DateTimeField()
+
+    class Meta:
+        verbose_name_plural = 'enclosure health'
+
+    def __unicode__(self):
+        return u'%s: %s' % (self.enclosure, self.status)
+
+
+from django.db.models.signals import pre_save, post_save, post_delete
+from podcast import probe, signals
+
+pre_save.connect(blobs.enclosure_pre_save, sender=Enclosure)
+post_save.connect(blobs.enclosure_saved, sender=Enclosure)
+post_delete.connect(blobs.enclosure_deleted, sender=Enclosure)
+
+# Probe enclosure files before the change is announced.
+post_save.connect(probe.enclosure_saved, sender=Enclosure)
+
+post_save.connect(signals.show_saved, sender=Show)
+post_delete.connect(signals.show_saved, sender=Show)
+post_save.connect(signals.episode_saved, sender=Episode)
+post_save.connect(signals.episode_scheduled, sender=Episode)
+post_delete.connect(signals.episode_saved, sender=Episode)
+post_save.connect(signals.touch_episode, sender=Enclosure)
+post_delete.connect(signals.touch_episode, sender=Enclosure)
+post_save.connect(signals.enclosure_saved, sender=Enclosure)
+post_delete.connect(signals.enclosure_saved, sender=Enclosure)
+
+from podcast import delta
+
+post_save.connect(delta.episode_saved, sender=Episode)
+post_delete.connect(delta.episode_deleted, sender=Episode)
+
+from podcast import renditions
+
+post_save.connect(renditions.image_saved, sender=Show)
+post_save.connect(renditions.image_saved, sender=Episode)
+
+from podcast import related
+
+post_save.connect(related.episode_saved, sender=Episode)
+
+from podcast import scan
+
+post_save.connect(scan.enclosure_saved, sender=Enclosure)
@@ -0,0 +1,362 @@
+"""
+Reads technical details from the headers of media files.
+
+Files are memory-mapped and only the header structures are read: the box
+tree of MP4, M4A and MOV files (skipping the media data), the first frame
+and Xing/Info or VBRI header of MP3 files, and the first and last pages of
+Ogg Vorbis and Opus files. Probing even a very large file touches a few
+kilobytes.
+
+``probe()`` returns a dictionary with any of ``bitrate`` (kbps), ``frame``
+(fps), ``sample`` (kHz), ``channel``, ``width``, ``height`` and
+``duration`` (seconds), as far as the file tells.
+"""
+import mmap
+import os
+import struct
+
+# Boxes that only contain other boxes
+MP4_CONTAINERS = (b'moov', b'trak', b'mdia', b'minf', b'stbl', b'edts')
+
+# Bitrates in kbps by MPEG version (1 or 2) and layer, indexed by header bits
+MP3_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384,
+             416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320,
+             384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256,
+             320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224,
+             256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# Sample rates in Hz by the version bits of the header
+MP3_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    0: (11025, 12000, 8000),
+}
+# How far into a file to look for the first MP3 frame or last Ogg page
+SCAN_LIMIT = 64 * 1024
+
+
+def _number(value, digits=2):
+    """Formats a number for the five-character technical fields."""
+    text = ('%.*f' % (digits, value)).rstrip('0').rstrip('.')
+    return text[:5]
+
+
+def _finish(info, size):
+    """Derives the average bitrate and formats the values."""
+    duration = info.get('duration')
+    if duration and 'bitrate' not in info:
+        info['bitrate'] = size * 8 / duration / 1000
+    result = {}
+    if 'bitrate' in info:
+        result['bitrate'] = '%d' % round(info['bitrate'])
+    if info.get('frame'):
+        result['frame'] = _number(info['frame'])
+    if info.get('sample'):
+        result['sample'] = _number(info['sample'] / 1000.0, 3)
+    for name in ('channel', 'width', 'height'):
+        if info.get(name):
+            result[name] = int(info[name])
+    if duration:
+        result['duration'] = duration
+    return result
+
+
+def _boxes(m, start, end):
+    """Yields (type, payload start, payload end) of the boxes in a range."""
+    offset = start
+    while offset + 8 <= end:
+        size, kind = struct.unpack('>I4s', m[offset:offset + 8])
+        header = 8
+        if size == 1:
+            size, = struct.unpack('>Q', m[offset + 8:offset + 16])
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            return
+        yield kind, offset + header, min(offset + size, end)
+        offset += size
+
+
+def _full_box(m, start):
+    """Returns the version of a full box and where its fields begin."""
+    return struct.unpack('>B', m[start:start + 1])[0], start + 4
+
+
+def probe_mp4(m):
+    info = {}
+    tracks = []
+
+    def walk(start, end, track):
+        for kind, begin, stop in _boxes(m, start, end):
+            if kind == b'trak':
+                track = {}
+                tracks.append(track)
+            if kind in MP4_CONTAINERS:
+                walk(begin, stop, track)
+            elif kind == b'mvhd':
+                version, pos = _full_box(m, begin)
+                if version == 1:
+                    scale, duration = struct.unpack('>IQ',
+                        m[pos + 16:pos + 28])
+                else:
+                    scale, duration = struct.unpack('>II',
+                        m[pos + 8:pos + 16])
+                if scale:
+                    info['duration'] = float(duration) / scale
+            elif kind == b'tkhd' and track is not None:
+                version, pos = _full_box(m, begin)
+                pos += 32 + 52 if version == 1 else 20 + 52
+                width, height = struct.unpack('>II', m[pos:pos + 8])
+                track['width'] = width >> 16
+                track['height'] = height >> 16
+            elif kind == b'mdhd' and track is not None:
+                version, pos = _full_box(m, begin)
+                if version == 1:
+                    scale, duration = struct.unpack('>IQ',
+                        m[pos + 16:pos + 28])
+                else:
+                    scale, duration = struct.unpack('>II',
+                        m[pos + 8:pos + 16])
+                track['timescale'] = scale
+                track['duration'] = duration
+            elif kind == b'hdlr' and track is not None:
+                track['handler'] = m[begin + 8:begin + 12]
+            elif kind == b'stsd' and track is not None:
+                entry = begin + 8
+                if track.get('handler') == b'soun':
+                    channels, bits, _, _, rate = struct.unpack('>HHHHI',
+                        m[entry + 24:entry + 36])
+                    track['channel'] = channels
+                    track['sample'] = rate >> 16
+            elif kind == b'stts' and track is not None:
+                count, = struct.unpack('>I', m[begin + 4:begin + 8])
+                if count:
+                    samples, delta = struct.unpack('>II',
+                        m[begin + 8:begin + 16])
+                    track['delta'] = delta
+
+    walk(0, len(m), None)
+    for track in tracks:
+        if track.get('handler') == b'vide':
+            if track.get('width'):
+                info['width'] = track['width']
+                info['height'] = track['height']
+            if track.get('delta') and track.get('timescale'):
+                info['frame'] = float(track['timescale']) / track['delta']
+        elif track.get('handler') == b'soun':
+            info.setdefault('channel', track.get('channel'))
+            info.setdefault('sample', track.get('sample'))
+    return info
+
+
+def _id3_end(m):
+    """Returns the offset after an ID3v2 tag at the start, if any."""
+    if m[:3] != b'ID3' or len(m) < 10:
+        return 0
+    flags, = struct.unpack('>B', m[5:6])
+    sizes = struct.unpack('>4B', m[6:10])
+    size = (sizes[0] << 21) | (sizes[1] << 14) | (sizes[2] << 7) | sizes[3]
+    return 10 + size + (10 if flags & 0x10 else 0)
+
+
+def _mp3_header(m, offset):
+    """Parses the MP3 frame header at ``offset`` or returns ``None``."""
+    if offset + 4 > len(m):
+        return None
+    header, = struct.unpack('>I', m[offset:offset + 4])
+    if header >> 21 != 0x7ff:
+        return None
+    version_bits = (header >> 19) & 3
+    layer_bits = (header >> 17) & 3
+    bitrate_index = (header >> 12) & 15
+    rate_index = (header >> 10) & 3
+    if version_bits == 1 or layer_bits == 0 or bitrate_index == 15 or \
+            rate_index == 3:
+        return None
+    version = 1 if version_bits == 3 else 2
+    layer = 4 - layer_bits
+    mono = (header >> 6) & 3 == 3
+    padding = (header >> 9) & 1
+    if layer == 1:
+        samples = 384
+        padding *= 4
+    elif layer == 3 and version == 2:
+        samples = 576
+    else:
+        samples = 1152
+    bitrate = MP3_BITRATES[(version, layer)][bitrate_index]
+    sample = MP3_SAMPLE_RATES[version_bits][rate_index]
+    return {
+        'version': version,
+        'layer': layer,
+        'bitrate': bitrate,
+        'sample': sample,
+        'channel': 1 if mono else 2,
+        'samples': samples,
+        # 0 for free-format frames, whose length the header does not give
+        'length': samples // 8 * bitrate * 1000 // sample + padding,
+    }
+
+
+def probe_mp3(m):
+    start = _id3_end(m)
+    limit = min(len(m), start + SCAN_LIMIT)
+    offset = m.find(b'\xff', start, limit)
+    frame = None
+    while offset != -1:
+        frame = _mp3_header(m, offset)
+        # A sync word in other data is rarely followed by a second one.
+        if frame and frame['length'] and _mp3_header(m,
+                offset + frame['length']):
+            break
+        frame = None
+        offset = m.find(b'\xff', offset + 1, limit)
+    if not frame:
+        return {}
+    info = {'sample': frame['sample'], 'channel': frame['channel']}
+    if frame['version'] == 1:
+        side = 17 if frame['channel'] == 1 else 32
+    else:
+        side = 9 if frame['channel'] == 1 else 17
+    frames = audio_bytes = None
+    xing = offset + 4 + side
+    vbri = offset + 4 + 32
+    if m[xing:xing + 4] in (b'Xing', b'Info'):
+        flags, = struct.unpack('>I', m[xing + 4:xing + 8])
+        pos = xing + 8
+        if flags & 1:
+            frames, = struct.unpack('>I', m[pos:pos + 4])
+            pos += 4
+        if flags & 2:
+            audio_bytes, = struct.unpack('>I', m[pos:pos + 4])
+    elif m[vbri:vbri + 4] == b'VBRI':
+        audio_bytes, frames = struct.unpack('>II', m[vbri + 10:vbri + 18])
+    if frames:
+        info['duration'] = float(frames) * frame['samples'] / frame['sample']
+        if audio_bytes:
+            info['bitrate'] = audio_bytes * 8 / info['duration'] / 1000
+    else:
+        info['bitrate'] = frame['bitrate']
+        if frame['bitrate']:
+            info['duration'] = (len(m) - offset) * 8.0 / \
+                (frame['bitrate'] * 1000)
+    return info
+
+
+def probe_ogg(m):
+    if m[:4] != b'OggS' or len(m) < 27:
+        return {}
+    segments, = struct.unpack('>B', m[26:27])
+    packet = 27 + segments
+    info = {}
+    rate = None
+    if m[packet:packet + 7] == b'\x01vorbis':
+        channels, rate, maximum, nominal = struct.unpack('<BIii',
+            m[packet + 11:packet + 24])
+        info['channel'] = channels
+        info['sample'] = rate
+        if nominal > 0:
+            info['bitrate'] = nominal / 1000.0
+    elif m[packet:packet + 8] == b'OpusHead':
+        channels, = struct.unpack('<B', m[packet + 9:packet + 10])
+        info['channel'] = channels
+        info['sample'] = 48000
+        rate = 48000
+    else:
+        return {}
+    last = m.rfind(b'OggS', max(0, len(m) - SCAN_LIMIT))
+    if rate and last != -1 and last + 14 <= len(m):
+        granule, = struct.unpack('<q', m[last + 6:last + 14])
+        if granule > 0:
+            info['duration'] = float(granule) / rate
+    return info
+
+
+def probe_mapped(m, mime=''):
+    """
+    Probes an already mapped file, choosing the parser by signature. MP3
+    files have none, so only files with an ID3 tag or of type
+    ``audio/mpeg`` are read as MP3.
+    """
+    if m[4:8] in (b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip'):
+        return probe_mp4(m)
+    if m[:4] == b'OggS':
+        return probe_ogg(m)
+    if m[:3] == b'ID3' or mime == 'audio/mpeg':
+        return probe_mp3(m)
+    return {}
+
+
+def probe(path, mime=''):
+    """
+    Probes the media file at ``path`` of type ``mime``; unknown formats
+    give ``{}``.
+    """
+    size = os.path.getsize(path)
+    if not size:
+        return {}
+    f = open(path, 'rb')
+    try:
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            info = probe_mapped(m, mime)
+        except (struct.error, KeyError, ZeroDivisionError):
+            info = {}
+        finally:
+            m.close()
+    finally:
+        f.close()
+    return _finish(info, size)
+
+
+# Enclosure fields filled in from a probe
+FIELDS = ('bitrate', 'frame', 'sample', 'channel', 'width', 'height')
+
+
+def local_path(enclosure):
+    """Returns the local path of an enclosure's file, if it has one."""
+    if not enclosure.file:
+        return None
+    try:
+        return enclosure.file.path
+    except NotImplementedError:
+        return None
+
+
+def enclosure_values(enclosure, info, force=False):
+    """The fields of ``enclosure`` to update from a probe's ``info``."""
+    values = {}
+    for name in FIELDS:
+        if name in info and (force or not getattr(enclosure, name)):
+            value = info[name]
+            if name not in ('width', 'height'):
+                value = str(value)
+            values[name] = value
+    return values
+
+
+def enclosure_saved(sender, instance, **kwargs):
+    """Fills in blank technical fields and the size of a saved file."""
+    path = local_path(instance)
+    if path is None:
+        return
+    fields = [name for name in FIELDS if not getattr(instance, name)]
+    if not fields and instance.size is not None:
+        return
+    try:
+        values = enclosure_values(instance, probe(path, instance.mime))
+        if instance.size is None:
+            values['size'] = os.path.getsize(path)
+    except (IOError, OSError, ValueError):
+        return
+    if values:
+        sender._default_manager.filter(pk=instance.pk).update(**values)
+        for name, value in values.items():
+            setattr(instance, name, value)
@@ -0,0 +1,330 @@
+"""
+Precomputed related episodes.
+
+Every published episode is described by a set of terms: its keywords, its
+category, its Media RSS categories, the iTunes categories of its show and
+the show itself. Terms are weighted by their inverse document frequency
+and episodes are compared by the cosine of their weight vectors, so a
+shared rare keyword counts for more than a shared show. The most similar
+``PODCAST_RELATED_EPISODES`` episodes of each episode are stored as
+``RelatedEpisode`` rows, which ``episode_detail`` reads with one query.
+
+``build()`` recomputes the whole table, with sparse matrices when NumPy
+and SciPy are installed and with an inverted index otherwise, and stores
+the terms of every public episode as ``EpisodeTerm`` rows. Saved
+episodes, and the episodes whose lists they appear in, are updated by a
+background worker from those rows: it replaces the terms of the saved
+episodes and compares only episodes sharing a term with them, taking the
+document frequencies from the stored terms. Terms shared by more than
+``POSTING_LIMIT`` episodes, such as a large show, only contribute their
+newest episodes as candidates. Scheduled episodes are indexed too, and
+left out when the lists are read.
+"""
+import heapq
+import logging
+import math
+
+try:
+    import numpy
+    from scipy import sparse
+except ImportError:
+    numpy = None
+
+from django.db import connections, router, transaction
+from django.db.models import Count
+
+from podcast import settings
+from podcast.models import Episode, EpisodeTerm, RelatedEpisode, Show
+from podcast.worker import BatchWorker
+
+logger = logging.getLogger('podcast.related')
+
+# Rows of the similarity matrix computed at once with NumPy
+BATCH_SIZE = 256
+# Episodes of a term looked at when updating; the newest are taken.
+POSTING_LIMIT = 500
+# Values per IN clause, below the parameter limit of SQLite
+CHUNK_SIZE = 500
+TERM_LENGTH = EpisodeTerm._meta.get_field('term').max_length
+
+
+def _chunks(values):
+    values = list(values)
+    for start in range(0, len(values), CHUNK_SIZE):
+        yield values[start:start + CHUNK_SIZE]
+
+
+def _words(text):
+    return [word.strip().lower() for word in (text or '').split(',')
+            if word.strip()]
+
+
+def _term(kind, value):
+    return ('%s:%s' % (kind, value))[:TERM_LENGTH]
+
+
+def public_episodes():
+    """Public episodes, including the scheduled ones."""
+    return Episode.objects.filter(status=2)
+
+
+def load_terms(pks=None):
+    """
+    Returns ``{episode pk: set of terms}`` of the public episodes, or of
+    those with ``pks``.
+    """
+    terms = {}
+    by_show = {}
+    episodes = public_episodes()
+    if pks is not None:
+        episodes = episodes.filter(pk__in=pks)
+    for pk, show_id, keywords, category in episodes.values_list(
+            'pk', 'show', 'keywords', 'category'):
+        found = set(_term('keyword', word) for word in _words(keywords))
+        if category:
+            found.add(_term('category', category.strip().lower()))
+        found.add(_term('show', show_id))
+        terms[pk] = found
+        by_show.setdefault(show_id, []).append(found)
+    media = Episode.media_category.through.objects.all()
+    shows = Show.category.through.objects.all()
+    if pks is not None:
+        media = media.filter(episode__in=pks)
+        shows = shows.filter(show__in=list(by_show))
+    for pk, category_id in media.values_list('episode', 'mediacategory'):
+        if pk in terms:
+            terms[pk].add(_term('media', category_id))
+    for show_id, category_id in shows.values_list('show', 'childcategory'):
+        for found in by_show.get(show_id, ()):
+            found.add(_term('itunes', category_id))
+    return terms
+
+
+def weigh(terms, frequency=None, total=None):
+    """
+    Turns term sets into normalised TF-IDF vectors, ``{term: weight}``.
+    Document frequencies and the number of documents are counted from
+    ``terms`` unless given.
+    """
+    if frequency is None:
+        frequency = {}
+        for found in terms.values():
+            for term in found:
+                frequency[term] = frequency.get(term, 0) + 1
+    total = float(total or len(terms))
+    vectors = {}
+    for pk, found in terms.items():
+        # Stored frequencies may briefly count episodes no longer public.
+        weights = dict((term, math.log(max(total / frequency[term], 1)))
+                       for term in found)
+        norm = math.sqrt(sum(w * w for w in weights.values()))
+        vectors[pk] = dict((term, weight / norm) for term, weight in
+                           weights.items() if weight) if norm else {}
+    return vectors
+
+
+def postings(vectors):
+    """Inverts the vectors into ``{term: [(pk, weight), ...]}``."""
+    index = {}
+    for pk, vector in vectors.items():
+        for term, weight in vector.items():
+            index.setdefault(term, []).append((pk, weight))
+    return index
+
+
+def neighbours(pk, vectors, index, count):
+    """Returns the ``count`` most similar episodes as (score, pk) pairs."""
+    scores = {}
+    for term, weight in vectors[pk].items():
+        for other, other_weight in index[term]:
+            if other != pk:
+                scores[other] = scores.get(other, 0.0) + weight * other_weight
+    return heapq.nlargest(count, [(score, other) for other, score in
+                                  scores.items() if score > 0])
+
+
+def _sparse_neighbours(vectors, count):
+    """Yields ``(pk, neighbours)`` of every episode using SciPy."""
+    pks = sorted(vectors)
+    columns = {}
+    rows, cols, data = [], [], []
+    for row, pk in enumerate(pks):
+        for term, weight in vectors[pk].items():
+            rows.append(row)
+            cols.append(columns.setdefault(term, len(columns)))
+            data.append(weight)
+    matrix = sparse.csr_matrix((numpy.array(data, dtype=numpy.float32),
+        (rows, cols)), shape=(len(pks), max(len(columns), 1)))
+    transposed = matrix.T.tocsc()
+    for start in range(0, len(pks), BATCH_SIZE):
+        scores = (matrix[start:start + BATCH_SIZE] * transposed).toarray()
+        for offset, row in enumerate(scores):
+            row[start + offset] = 0
+            if len(row) > count:
+                top = numpy.argpartition(-row, count)[:count]
+            else:
+                top = numpy.arange(len(row))
+            found = sorted(((float(row[i]), pks[i]) for i in top
+                            if row[i] > 0), reverse=True)
+            yield pks[start + offset], found
+
+
+def _insert(using, pk, found):
+    """Inserts the related episodes of ``pk`` with a single statement."""
+    if not found:
+        return
+    meta = RelatedEpisode._meta
+    qn = connections[using].ops.quote_name
+    columns = [qn(meta.get_field(name).column) for name in
+               ('episode', 'related', 'rank', 'score')]
+    connections[using].cursor().executemany(
+        'INSERT INTO %s (%s) VALUES (%%s, %%s, %%s, %%s)' % (
+            qn(meta.db_table), ', '.join(columns)),
+        [(pk, other, rank, score) for rank, (score, other) in
+         enumerate(found)])
+    transaction.set_dirty(using=using)
+
+
+def _insert_terms(using, terms):
+    """Inserts the terms of the episodes in ``terms``."""
+    meta = EpisodeTerm._meta
+    qn = connections[using].ops.quote_name
+    columns = [qn(meta.get_field(name).column) for name in
+               ('episode', 'term')]
+    rows = [(pk, term) for pk, found in terms.items() for term in found]
+    if rows:
+        connections[using].cursor().executemany(
+            'INSERT INTO %s (%s) VALUES (%%s, %%s)' % (
+                qn(meta.db_table), ', '.join(columns)), rows)
+        transaction.set_dirty(using=using)
+
+
+def build(count=None):
+    """Replaces all related episodes and returns the number of rows."""
+    count = count or settings.RELATED_EPISODES
+    terms = load_terms()
+    vectors = weigh(terms)
+    if numpy is not None:
+        pairs = _sparse_neighbours(vectors, count)
+    else:
+        index = postings(vectors)
+        pairs = ((pk, neighbours(pk, vectors, index, count))
+                 for pk in vectors)
+    using = router.db_for_write(RelatedEpisode)
+
+    def apply():
+        EpisodeTerm.objects.using(using).all().delete()
+        _insert_terms(using, terms)
+        RelatedEpisode.objects.using(using).all().delete()
+        rows = 0
+        for pk, found in pairs:
+            _insert(using, pk, found)
+            rows += len(found)
+        return rows
+
+    return transaction.commit_on_success(using=using)(apply)()
+
+
+def _stored_terms(using, pks):
+    """Returns ``{episode pk: set of terms}`` from the stored terms."""
+    terms = {}
+    for chunk in _chunks(pks):
+        for pk, term in EpisodeTerm.objects.using(using).filter(
+                episode__in=chunk).values_list('episode', 'term'):
+            terms.setdefault(pk, set()).add(term)
+    return terms
+
+
+def _frequencies(using, terms):
+    """Returns the number of episodes with each of ``terms``."""
+    frequency = {}
+    for chunk in _chunks(terms):
+        frequency.update(EpisodeTerm.objects.using(using).filter(
+            term__in=chunk).values_list('term').annotate(Count('episode')))
+    return frequency
+
+
+def _candidates(using, frequency):
+    """Returns the episodes sharing any of the terms in ``frequency``."""
+    found = set()
+    terms = EpisodeTerm.objects.using(using)
+    rare = [term for term, n in frequency.items() if n <= POSTING_LIMIT]
+    for chunk in _chunks(rare):
+        found.update(terms.filter(term__in=chunk).values_list('episode',
+            flat=True))
+    for term, n in frequency.items():
+        if n > POSTING_LIMIT:
+            found.update(terms.filter(term=term).order_by(
+                '-episode').values_list('episode', flat=True)[
+                    :POSTING_LIMIT])
+    return found
+
+
+def related_to(using, pks, count):
+    """
+    Returns ``{pk: neighbours}`` of the episodes with ``pks``, comparing
+    them only with the episodes that share a term with them.
+    """
+    terms = _stored_terms(using, pks)
+    frequency = _frequencies(using, set().union(*terms.values()))
+    others = _stored_terms(using, _candidates(using, frequency) -
+                           set(terms))
+    frequency.update(_frequencies(using, set().union(*others.values()) -
+                                  set(frequency)))
+    terms.update(others)
+    vectors = weigh(terms, frequency,
+                    public_episodes().using(using).count())
+    index = postings(vectors)
+    return dict((pk, neighbours(pk, vectors, index, count))
+                for pk in pks if pk in vectors)
+
+
+def update(pks, count=None):
+    """
+    Replaces the stored terms of the episodes with ``pks`` and recomputes
+    their related episodes, those of their new neighbours and those of the
+    episodes that listed them.
+    """
+    count = count or settings.RELATED_EPISODES
+    using = router.db_for_write(RelatedEpisode)
+    terms = {}
+    for chunk in _chunks(pks):
+        terms.update(load_terms(chunk))
+
+    def store():
+        for chunk in _chunks(pks):
+            EpisodeTerm.objects.using(using).filter(
+                episode__in=chunk).delete()
+        _insert_terms(using, terms)
+
+    transaction.commit_on_success(using=using)(store)()
+    found = related_to(using, list(terms), count)
+    affected = set(pks)
+    for chunk in _chunks(pks):
+        affected.update(RelatedEpisode.objects.using(using).filter(
+            related__in=chunk).values_list('episode', flat=True))
+    for neighbours_of in found.values():
+        affected.update(other for score, other in neighbours_of)
+    found.update(related_to(using, list(affected - set(found)), count))
+
+    def apply():
+        for chunk in _chunks(affected):
+            RelatedEpisode.objects.using(using).filter(
+                episode__in=chunk).delete()
+        for pk, neighbours_of in found.items():
+            _insert(using, pk, neighbours_of)
+
+    transaction.commit_on_success(using=using)(apply)()
+
+
+def _update_batch(batch):
+    try:
+        update(list(batch.values()))
+    except Exception:
+        logger.exception('Cannot update related episodes')
+
+worker = BatchWorker(_update_batch, name='podcast-related')
+
+
+def episode_saved(sender, instance, **kwargs):
+    worker.add(instance.pk, instance.pk, settings.RELATED_DELAY)
@@ -0,0 +1,174 @@
+"""
+Resized renditions of show and episode images.
+
+Saving a show or episode with an image queues it for a background worker,
+which decodes the image once, records its size as the "original"
+rendition and writes the renditions configured in ``PODCAST_RENDITIONS``.
+Renditions are stored under the SHA-1 of their bytes, so identical
+renditions are stored once. Templates pick a rendition with the
+``rendition`` filter from the ``podcast_tags`` library and never decode
+the original themselves.
+"""
+import datetime
+import hashlib
+import io
+import logging
+
+try:
+    from PIL import Image
+except ImportError:
+    import Image
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+
+from podcast import settings
+from podcast.models import Rendition
+from podcast.signals import shows_changed
+from podcast.worker import BatchWorker
+
+logger = logging.getLogger('podcast.renditions')
+
+RENDITIONS_KEY = 'podcast:renditions:%s'
+RENDITIONS_TIMEOUT = 60 * 60 * 24
+
+
+class RenditionImage(object):
+    """The URL and size of a rendition, as used by templates."""
+
+    def __init__(self, url, width, height):
+        self.url = url
+        self.width = width
+        self.height = height
+
+    def __unicode__(self):
+        return self.url
+
+
+def _cache_key(source):
+    return RENDITIONS_KEY % hashlib.md5(source).hexdigest()
+
+
+def renditions_for(source):
+    """Returns ``{spec: (url, width, height)}`` for a stored image."""
+    key = _cache_key(source)
+    found = cache.get(key)
+    if found is None:
+        found = dict((r.spec, (r.file.url, r.width, r.height))
+                     for r in Rendition.objects.filter(source=source))
+        cache.set(key, found, RENDITIONS_TIMEOUT)
+    return found
+
+
+def pick(image, specs):
+    """
+    Returns the first of ``specs`` made of ``image``, or the original with
+    its recorded size. Until the renditions exist, ``image`` itself is
+    returned.
+    """
+    if not image:
+        return image
+    found = renditions_for(image.name)
+    for spec in list(specs) + ['original']:
+        if spec in found:
+            return RenditionImage(*found[spec])
+    return image
+
+
+def resize(original, width, height, square):
+    """Returns the resized image, or ``None`` if it would not be smaller."""
+    if square:
+        side = min(original.size)
+        if side < width:
+            return None
+        left = (original.size[0] - side) // 2
+        top = (original.size[1] - side) // 2
+        return original.crop((left, top, left + side, top + side)).resize(
+            (width, height), Image.ANTIALIAS)
+    if original.size[0] <= width and original.size[1] <= height:
+        return None
+    image = original.copy()
+    image.thumbnail((width, height), Image.ANTIALIAS)
+    return image
+
+
+def encode(image):
+    """Returns the bytes and file extension of an encoded rendition."""
+    buf = io.BytesIO()
+    if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+        image.save(buf, 'PNG', optimize=True)
+        return buf.getvalue(), 'png'
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.save(buf, 'JPEG', quality=settings.RENDITION_QUALITY,
+        optimize=True, progressive=True)
+    return buf.getvalue(), 'jpg'
+
+
+def store(data, extension):
+    """Stores rendition bytes under their hash and returns the name."""
+    field = Rendition._meta.get_field('file')
+    digest = hashlib.sha1(data).hexdigest()
+    name = '%s%s/%s.%s' % (field.upload_to, digest[:2], digest, extension)
+    if not field.storage.exists(name):
+        name = field.storage.save(name, ContentFile(data))
+    return name
+
+
+def generate(image):
+    """Decodes ``image`` once and (re)creates all of its renditions."""
+    source = image.name
+    image.open('rb')
+    try:
+        original = Image.open(image)
+        original.load()
+    finally:
+        image.close()
+    Rendition.objects.filter(source=source).delete()
+    Rendition.objects.create(source=source, spec='original', file=source,
+        width=original.size[0], height=original.size[1])
+    for spec, (width, height, square) in settings.RENDITIONS.items():
+        resized = resize(original, width, height, square)
+        if resized is None:
+            continue
+        data, extension = encode(resized)
+        Rendition.objects.create(source=source, spec=spec,
+            file=store(data, extension), width=resized.size[0],
+            height=resized.size[1])
+    cache.delete(_cache_key(source))
+
+
+def has_renditions(image):
+    return Rendition.objects.filter(source=image.name,
+        spec='original').exists()
+
+
+def _generate_batch(batch):
+    for model, pk in batch.values():
+        try:
+            instance = model._default_manager.get(pk=pk)
+        except model.DoesNotExist:
+            continue
+        if not instance.image or has_renditions(instance.image):
+            continue
+        try:
+            generate(instance.image)
+        except (IOError, ValueError):
+            logger.exception('Cannot make renditions of %s',
+                instance.image.name)
+            continue
+        show = getattr(instance, 'show', instance)
+        if show is not instance:
+            # Expires the episode's cached fragments and puts it in feed
+            # deltas, like a changed enclosure.
+            model._default_manager.filter(pk=pk).update(
+                update=datetime.datetime.now())
+        # Feeds rendered meanwhile point at the original.
+        shows_changed.send(sender=model, shows=[show])
+
+worker = BatchWorker(_generate_batch, name='podcast-renditions')
+
+
+def image_saved(sender, instance, **kwargs):
+    if instance.image:
+        worker.add((sender.__name__, instance.pk), (sender, instance.pk))
@@ -0,0 +1,82 @@
+"""
+Database router sending podcast reads to replicas.
+
+Add it to ``DATABASE_ROUTERS`` and list the replica aliases in
+``PODCAST_READ_DATABASES``. The public views pick a database once per
+request with ``read_database()`` and run their queries there; related
+lookups made from the fetched objects, for instance in templates, follow
+them to the same database. Everything else, including the admin, reads
+and writes the primary database.
+
+Changes to a show pin reads to the primary for
+``PODCAST_REPLICA_PIN_SECONDS``, so freshly published episodes are not
+missed while the replicas catch up.
+"""
+import random
+import time
+
+from django.core.cache import cache
+
+from podcast import settings
+
+PIN_KEY = 'podcast:pin-primary'
+
+_pinned_until = 0
+
+
+def pin_primary(seconds=None):
+    """Sends all reads to the primary for the next ``seconds``."""
+    global _pinned_until
+    if seconds is None:
+        seconds = settings.REPLICA_PIN_SECONDS
+    until = time.time() + seconds
+    _pinned_until = until
+    cache.set(PIN_KEY, until, seconds)
+
+
+def is_pinned():
+    if _pinned_until > time.time():
+        return True
+    until = cache.get(PIN_KEY)
+    return until is not None and until > time.time()
+
+
+def read_database():
+    """Returns the alias of the database the current request reads from."""
+    if not settings.READ_DATABASES or is_pinned():
+        return settings.PRIMARY_DATABASE
+    return random.choice(settings.READ_DATABASES)
+
+
+def pin_changed_shows(sender, shows, **kwargs):
+    pin_primary()
+
+
+class PodcastRouter(object):
+
+    def _databases(self):
+        return [settings.PRIMARY_DATABASE] + list(settings.READ_DATABASES)
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in self._databases():
+            return instance._state.db
+        if model._meta.app_label == 'podcast':
+            return settings.PRIMARY_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == 'podcast':
+            return settings.PRIMARY_DATABASE
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = self._databases()
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_syncdb(self, db, model):
+        if model._meta.app_label == 'podcast':
+            return db == settings.PRIMARY_DATABASE
+        return None
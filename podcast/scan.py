@@ -0,0 +1,63 @@
+"""
+Integrity checks of enclosures.
+
+``check()`` looks at one enclosure: that it has a file or a player, that
+its file exists in the storage, and that the file still has the size and
+hash recorded for it. ``podcast_scan`` runs it over the whole library and
+keeps the results in ``EnclosureHealth``; feeds, sitemaps and pages leave
+out enclosures whose status is in ``PODCAST_BROKEN_HEALTH`` rather than
+failing while rendering them. Saving an enclosure forgets its health
+until the next scan.
+"""
+import hashlib
+
+# Bytes read at a time while hashing
+BLOCK_SIZE = 1024 * 1024
+HASHES = {
+    'MD5': hashlib.md5,
+    'SHA-1': hashlib.sha1,
+}
+
+
+def _digest(storage, name, algo):
+    hasher = HASHES[algo]()
+    f = storage.open(name, 'rb')
+    try:
+        for data in iter(lambda: f.read(BLOCK_SIZE), b''):
+            hasher.update(data)
+    finally:
+        f.close()
+    return hasher.hexdigest()
+
+
+def check(enclosure, hashes=True):
+    """
+    Returns the status and detail of ``enclosure`` and the size of its
+    file, or ``None`` if it has no readable file. Only reads the storage,
+    so it can run in any thread.
+    """
+    if not enclosure.file:
+        if enclosure.player:
+            return 'ok', '', None
+        return 'empty', '', None
+    storage, name = enclosure.file.storage, enclosure.file.name
+    try:
+        if not storage.exists(name):
+            return 'missing', '', None
+        size = storage.size(name)
+        if enclosure.size is not None and size != enclosure.size:
+            return 'size', 'recorded %d, file %d' % (enclosure.size,
+                size), size
+        if hashes and enclosure.hash and enclosure.algo in HASHES:
+            digest = _digest(storage, name, enclosure.algo)
+            if digest != enclosure.hash.lower():
+                return 'hash', '%s %s' % (enclosure.algo, digest), size
+    except (IOError, OSError) as e:
+        return 'missing', str(e)[:255], None
+    return 'ok', '', size
+
+
+def enclosure_saved(sender, instance, **kwargs):
+    """Forgets the health of a changed enclosure until it is checked."""
+    from podcast.models import EnclosureHealth
+    EnclosureHealth.objects.filter(enclosure=instance).delete()
@@ -6,6 +6,113 @@ from django.conf import settings
 # Django by default verifies a URL whening using URLField. Make this optional
 VERIFY_URLS = getattr(settings, 'PODCAST_VERIFY_URLS', True)
 
+# Rendered feeds and sitemaps are cached together with their precompressed
+# variants, so compression happens once per content change.
+FEED_CACHE_TIMEOUT = getattr(settings, 'PODCAST_FEED_CACHE_TIMEOUT', 300)
+# Content-codings to precompress, in order of preference. Brotli and
+# Zstandard are only used when the ``brotli`` and ``zstandard`` modules are
+# installed.
+PRECOMPRESS_ENCODINGS = getattr(settings, 'PODCAST_PRECOMPRESS_ENCODINGS', 
+    ('br', 'zstd', 'gzip'))
+# Documents smaller than this many bytes are served uncompressed.
+PRECOMPRESS_MIN_LENGTH = getattr(settings, 'PODCAST_PRECOMPRESS_MIN_LENGTH', 
+    200)
+# Seconds other requests serve the previous version of a document while one
+# request renders the new one.
+RENDER_LOCK_TIMEOUT = getattr(settings, 'PODCAST_RENDER_LOCK_TIMEOUT', 30)
+
+# WebSub (PubSubHubbub) hubs advertised in the feeds and pinged on changes.
+WEBSUB_HUBS = getattr(settings, 'PODCAST_WEBSUB_HUBS', ())
+# Scheme and host of the feed URLs sent to hubs, e.g. "http://example.com".
+# Defaults to the domain of the current Site.
+WEBSUB_BASE_URL = getattr(settings, 'PODCAST_WEBSUB_BASE_URL', None)
+# Seconds to wait after a change so that a burst of edits sends one ping.
+WEBSUB_DELAY = getattr(settings, 'PODCAST_WEBSUB_DELAY', 5)
+# Attempts per ping, and the delay in seconds before the first retry, which
+# doubles with every further attempt.
+WEBSUB_RETRIES = getattr(settings, 'PODCAST_WEBSUB_RETRIES', 5)
+WEBSUB_BACKOFF = getattr(settings, 'PODCAST_WEBSUB_BACKOFF', 30)
+WEBSUB_TIMEOUT = getattr(settings, 'PODCAST_WEBSUB_TIMEOUT', 10)
+
+# Database aliases of read replicas used by podcast.routers.PodcastRouter,
+# and of the primary database that takes all writes.
+READ_DATABASES = getattr(settings, 'PODCAST_READ_DATABASES', ())
+PRIMARY_DATABASE = getattr(settings, 'PODCAST_PRIMARY_DATABASE', 'default')
+# Seconds to read from the primary after a show changes, which should cover
+# the replication lag.
+REPLICA_PIN_SECONDS = getattr(settings, 'PODCAST_REPLICA_PIN_SECONDS', 10)
+
+# Largest chunk in bytes accepted by the resumable enclosure upload, and
+# the chunk size the admin widget sends.
+UPLOAD_CHUNK_SIZE = getattr(settings, 'PODCAST_UPLOAD_CHUNK_SIZE', 
+    8 * 1024 * 1024)
+# Hash algorithm (one of ALGO_CHOICES) computed while assembling uploads.
+UPLOAD_HASH_ALGO = getattr(settings, 'PODCAST_UPLOAD_HASH_ALGO', 'SHA-1')
+# Seconds after which unfinished uploads are discarded.
+UPLOAD_EXPIRE = getattr(settings, 'PODCAST_UPLOAD_EXPIRE', 60 * 60 * 24)
+# Seconds after which an unfinished assembly is taken to have died with
+# its process and is started again.
+UPLOAD_ASSEMBLY_TIMEOUT = getattr(settings,
+    'PODCAST_UPLOAD_ASSEMBLY_TIMEOUT', 60 * 60)
+
+# Where enclosure files are stored under the SHA-1 of their content, and
+# how many seconds an unreferenced file is kept after it was last stored
+# or referenced before podcast_gc removes it, which covers files uploaded
+# for enclosures not saved yet.
+BLOB_DIR = getattr(settings, 'PODCAST_BLOB_DIR', 'podcasts/blobs/')
+BLOB_GRACE = getattr(settings, 'PODCAST_BLOB_GRACE', 60 * 60 * 24)
+
+# Resized copies made of every show and episode image, as
+# name: (width, height, square). Square renditions are cropped to the
+# centre and only made from images at least that large; others are scaled
+# to fit within the box.
+RENDITIONS = getattr(settings, 'PODCAST_RENDITIONS', {
+    'thumbnail': (144, 144, False),
+    'itunes': (1400, 1400, True),
+    'itunes_large': (3000, 3000, True),
+})
+RENDITION_QUALITY = getattr(settings, 'PODCAST_RENDITION_QUALITY', 85)
+
+# Feed versions per show that clients can fetch an RFC 3229 delta against.
+DELTA_VERSIONS = getattr(settings, 'PODCAST_DELTA_VERSIONS', 20)
+# Seconds a delta reaches back before the rendering of the client's
+# version, to include episodes saved in transactions that had not
+# committed yet or that a lagging replica did not have. At least
+# REPLICA_PIN_SECONDS plus the longest transaction that saves episodes.
+DELTA_MARGIN = getattr(settings, 'PODCAST_DELTA_MARGIN',
+    REPLICA_PIN_SECONDS + 60)
+
+# Related episodes kept per episode, and seconds to wait after an episode
+# is saved before updating its related episodes.
+RELATED_EPISODES = getattr(settings, 'PODCAST_RELATED_EPISODES', 5)
+RELATED_DELAY = getattr(settings, 'PODCAST_RELATED_DELAY', 30)
+
+# Seconds to cache the rendered episode blocks of the HTML pages. They are
+# keyed on the time the episode was last updated, so this can be long.
+FRAGMENT_CACHE_TIMEOUT = getattr(settings, 'PODCAST_FRAGMENT_CACHE_TIMEOUT', 
+    60 * 60 * 24)
+# Cache whole episode pages for anonymous visitors until their show changes
+# or FEED_CACHE_TIMEOUT passes.
+PAGE_CACHE = getattr(settings, 'PODCAST_PAGE_CACHE', False)
+
+# Shows without a TTL of their own advertise a TTL (and Cache-Control
+# max-age) of this fraction of the median time between their last
+# CADENCE_EPISODES episodes, bounded by TTL_MIN and TTL_MAX minutes.
+CADENCE_EPISODES = getattr(settings, 'PODCAST_CADENCE_EPISODES', 10)
+TTL_FRACTION = getattr(settings, 'PODCAST_TTL_FRACTION', 4)
+TTL_MIN = getattr(settings, 'PODCAST_TTL_MIN', 15)
+TTL_MAX = getattr(settings, 'PODCAST_TTL_MAX', 60 * 24)
+# Feed requests allowed per hour for each client and feed, after a burst of
+# THROTTLE_BURST. Clients over the limit get 304 Not Modified if they have
+# the current feed and 429 Too Many Requests otherwise. Clients are told
+# apart by 'ip', 'user-agent' or 'both'. 0 turns throttling off.
+THROTTLE_RATE = getattr(settings, 'PODCAST_THROTTLE_RATE', 0)
+THROTTLE_BURST = getattr(settings, 'PODCAST_THROTTLE_BURST', 5)
+THROTTLE_BY = getattr(settings, 'PODCAST_THROTTLE_BY', 'ip')
+# Threads podcast_scan checks enclosure files with; the bound on concurrent
+# reads from the storage.
+SCAN_THREADS = getattr(settings, 'PODCAST_SCAN_THREADS', 4)
+
 PARENT_CHOICES = (
     ('Arts', 'Arts'),
     ('Business', 'Business'),
@@ -362,4 +469,13 @@ EXPRESSION_CHOICES = (
 ALGO_CHOICES = (
     ('MD5', 'MD5'),
     ('SHA-1', 'SHA-1'),
-)
\ No newline at end of file
+)
+HEALTH_CHOICES = (
+    ('ok', 'OK'),
+    ('missing', 'File missing'),
+    ('size', 'Size differs'),
+    ('hash', 'Hash differs'),
+    ('empty', 'No file or player'),
+)
+# Health of enclosures left out of feeds, sitemaps and pages
+BROKEN_HEALTH = ('missing', 'empty')
\ No newline at end of file
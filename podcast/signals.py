@@ -0,0 +1,89 @@
+"""
+Change notification for shows.
+
+Saving or deleting a show, an episode or an enclosure sends one
+``shows_changed`` signal naming the affected shows. Everything that
+depends on the published state of a show listens to that signal rather
+than to the individual model signals.
+"""
+import datetime
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.dispatch import Signal
+
+from podcast import feedcache, routers, websub
+from podcast.worker import BatchWorker
+
+shows_changed = Signal(providing_args=['shows'])
+
+
+def show_saved(sender, instance, **kwargs):
+    shows_changed.send(sender=sender, shows=[instance])
+
+
+def episode_saved(sender, instance, **kwargs):
+    try:
+        show = instance.show
+    except ObjectDoesNotExist:
+        # Cascading delete of the show, which sends its own notification.
+        return
+    shows_changed.send(sender=sender, shows=[show])
+
+
+def _publish_due(batch):
+    for (show_id, date), (sender, show) in batch.items():
+        shows_changed.send(sender=sender, shows=[show])
+
+scheduler = BatchWorker(_publish_due, name='podcast-scheduler')
+
+
+def schedule_publication(sender, show, date):
+    """Sends ``shows_changed`` for ``show`` at ``date``, if in the future."""
+    wait = date - datetime.datetime.now()
+    if wait > datetime.timedelta(0):
+        scheduler.add((show.pk, date), (sender, show),
+            wait.days * 86400 + wait.seconds + 1)
+
+
+def episode_scheduled(sender, instance, **kwargs):
+    """
+    Sends ``shows_changed`` again when an episode saved with a future date
+    goes live, since nothing else marks that moment. Schedules are kept in
+    memory only, so cached documents also expire on their own.
+    """
+    if instance.status == 2:
+        schedule_publication(sender, instance.show, instance.date)
+
+
+def touch_episode(sender, instance, **kwargs):
+    """
+    Marks the episode of a saved or deleted enclosure as updated, which
+    expires its cached fragments and puts it in feed deltas.
+    """
+    from podcast.models import Episode
+    Episode.objects.filter(pk=instance.episode_id).update(
+        update=datetime.datetime.now())
+
+
+def enclosure_saved(sender, instance, **kwargs):
+    try:
+        show = instance.episode.show
+    except ObjectDoesNotExist:
+        return
+    shows_changed.send(sender=sender, shows=[show])
+
+
+def update_aggregates(sender, shows, **kwargs):
+    for show in shows:
+        if show.pk is not None:
+            show.update_aggregates()
+
+
+def invalidate_documents(sender, shows, **kwargs):
+    for show in shows:
+        feedcache.bump_version(show.slug)
+
+shows_changed.connect(update_aggregates)
+shows_changed.connect(routers.pin_changed_shows)
+shows_changed.connect(invalidate_documents)
+shows_changed.connect(websub.ping_changed_shows)
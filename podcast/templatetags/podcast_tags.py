@@ -0,0 +1,16 @@
+from django import template
+
+from podcast import renditions
+
+register = template.Library()
+
+
+@register.filter
+def rendition(image, specs):
+    """
+    Picks a rendition of a show or episode image, e.g. 
+    ``{% with show.image|rendition:"itunes_large,itunes" as image %}``. 
+    Falls back to the original, which has ``url``, ``width`` and ``height`` 
+    just the same.
+    """
+    return renditions.pick(image, specs.split(','))
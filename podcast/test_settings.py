@@ -0,0 +1,50 @@
+"""
+Settings for running the tests of the podcast app on their own::
+
+    django-admin.py test podcast --settings=podcast.test_settings
+
+Two separate SQLite databases stand for a primary and a replica. The
+tests copy the podcast tables to the replica themselves, in place of
+replication, so a read from the wrong one sees different rows.
+"""
+import os
+import tempfile
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(tempfile.gettempdir(), 'podcast.db'),
+        'TEST_NAME': os.path.join(tempfile.gettempdir(), 'podcast-test.db'),
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(tempfile.gettempdir(), 'podcast-replica.db'),
+        'TEST_NAME': os.path.join(tempfile.gettempdir(),
+            'podcast-replica-test.db'),
+    },
+}
+DATABASE_ROUTERS = ['podcast.routers.PodcastRouter']
+PODCAST_READ_DATABASES = ('replica',)
+
+CACHE_BACKEND = 'locmem://'
+SITE_ID = 1
+SECRET_KEY = 'podcast-tests'
+MEDIA_ROOT = os.path.join(tempfile.gettempdir(), 'podcast-test-media')
+MEDIA_URL = '/media/'
+ADMIN_MEDIA_PREFIX = '/media/admin/'
+ROOT_URLCONF = 'podcast.test_urls'
+
+INSTALLED_APPS = (
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.sites',
+    'podcast',
+)
+MIDDLEWARE_CLASSES = (
+    'django.middleware.common.CommonMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+)
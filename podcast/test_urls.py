@@ -0,0 +1,10 @@
+"""URLconf of ``podcast.test_settings``."""
+from django.conf.urls.defaults import *
+from django.contrib import admin
+
+admin.autodiscover()
+
+urlpatterns = patterns('',
+    (r'^admin/', include(admin.site.urls)),
+    (r'^podcasts/', include('podcast.urls')),
+)
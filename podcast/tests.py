@@ -0,0 +1,180 @@
+"""
+Tests of the routing of podcast reads to replica databases.
+
+They need a ``default`` and a ``replica`` database with the router
+installed; ``podcast.test_settings`` sets up two SQLite databases::
+
+    django-admin.py test podcast --settings=podcast.test_settings
+"""
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import connections, router, transaction
+from django.db.models import get_app, get_models
+from django.test import TransactionTestCase
+
+from podcast import routers, settings
+from podcast.models import Episode, Show
+
+
+class Clock(object):
+    """Stands in for the ``time`` module, ``offset`` seconds ahead."""
+
+    def __init__(self, offset):
+        self.offset = offset
+
+    def time(self):
+        return time.time() + self.offset
+
+
+# The primary's rows must be committed to be copied to the replica, so the
+# tests do not run inside a transaction.
+class ReplicaTestCase(TransactionTestCase):
+    multi_db = True
+
+    def setUp(self):
+        if 'replica' not in settings.READ_DATABASES:
+            self.skipTest('Run with podcast.test_settings.')
+        cache.clear()
+        self.show = Show.objects.create(organization='Example',
+            title='Example Show', slug='example',
+            link='http://example.com/', description='A show.')
+        self.episode = Episode.objects.create(show=self.show,
+            title='First Episode', slug='first', description='An episode.')
+        self.replicate()
+        self.unpin()
+
+    def replicate(self):
+        """
+        Copies the podcast tables of the primary to the replica, where the
+        router does not let ``syncdb`` create them.
+        """
+        cursor = connections['replica'].cursor()
+        cursor.execute('ATTACH DATABASE %s AS source',
+            [connections['default'].settings_dict['NAME']])
+        try:
+            for model in get_models(get_app('podcast'),
+                    include_auto_created=True):
+                name = model._meta.db_table
+                table = connections['replica'].ops.quote_name(name)
+                cursor.execute('DROP TABLE IF EXISTS main.%s' % table)
+                cursor.execute("SELECT sql FROM source.sqlite_master "
+                    "WHERE type = 'table' AND name = %s", [name])
+                cursor.execute(cursor.fetchone()[0])
+                cursor.execute('INSERT INTO main.%s SELECT * FROM '
+                    'source.%s' % (table, table))
+            transaction.commit_unless_managed(using='replica')
+        finally:
+            cursor.execute('DETACH DATABASE source')
+
+    def tearDown(self):
+        routers.time = time
+        self.unpin()
+
+    def unpin(self):
+        """Ends the pin to the primary left by saving the test data."""
+        routers._pinned_until = 0
+        cache.delete(routers.PIN_KEY)
+
+    def get_episode(self):
+        return self.client.get(reverse('podcast_episode', kwargs={
+            'show_slug': 'example', 'episode_slug': 'first'}))
+
+
+class ViewTest(ReplicaTestCase):
+
+    def test_episode_detail_reads_replica(self):
+        response = self.get_episode()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['object']._state.db, 'replica')
+        # Lookups from the episode follow it to the replica.
+        self.assertEqual(response.context['enclosure_list'].db, 'replica')
+        self.assertEqual(response.context['object'].show._state.db,
+            'replica')
+
+    def test_replica_lags(self):
+        # Changed without signals, so nothing pins reads to the primary.
+        Episode.objects.filter(pk=self.episode.pk).update(title='Renamed')
+        self.assertEqual(self.get_episode().context['object'].title,
+            'First Episode')
+
+    def test_episode_list_reads_replica(self):
+        response = self.client.get(reverse('podcast_episodes',
+            kwargs={'slug': 'example'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['object']._state.db, 'replica')
+        episodes = list(response.context['object_list'])
+        self.assertEqual([e.slug for e in episodes], ['first'])
+        self.assertEqual(episodes[0]._state.db, 'replica')
+
+    def test_show_list_reads_replica(self):
+        response = self.client.get(reverse('podcast_shows'))
+        self.assertEqual(response.status_code, 200)
+        shows = list(response.context['object_list'])
+        self.assertEqual(shows[0]._state.db, 'replica')
+
+
+class WriteTest(ReplicaTestCase):
+
+    def test_router(self):
+        self.assertEqual(router.db_for_write(Episode), 'default')
+        # Reads outside the public views stay on the primary.
+        self.assertEqual(router.db_for_read(Episode), 'default')
+        self.assertEqual(Episode.objects.get(pk=self.episode.pk)._state.db,
+            'default')
+
+    def test_save_from_replica_writes_primary(self):
+        episode = Episode.objects.using('replica').get(pk=self.episode.pk)
+        episode.title = 'Renamed'
+        episode.save()
+        self.assertEqual(episode._state.db, 'default')
+        self.assertEqual(Episode.objects.using('default').get(
+            pk=episode.pk).title, 'Renamed')
+
+
+class AdminTest(ReplicaTestCase):
+
+    def setUp(self):
+        super(AdminTest, self).setUp()
+        User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.login(username='admin', password='pw')
+
+    def test_change_page_reads_primary(self):
+        response = self.client.get('/admin/podcast/episode/%d/' %
+            self.episode.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['original']._state.db, 'default')
+
+    def test_action_writes_primary(self):
+        response = self.client.post('/admin/podcast/episode/', {
+            'action': 'unpublish',
+            '_selected_action': [self.episode.pk]})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Episode.objects.using('default').get(
+            pk=self.episode.pk).status, 1)
+
+
+class PinTest(ReplicaTestCase):
+
+    def test_save_pins_primary(self):
+        self.assertEqual(routers.read_database(), 'replica')
+        self.episode.title = 'Changed'
+        self.episode.save()
+        self.assertEqual(routers.read_database(), 'default')
+        episode = self.get_episode().context['object']
+        self.assertEqual(episode._state.db, 'default')
+        self.assertEqual(episode.title, 'Changed')
+
+    def test_pin_expires(self):
+        self.episode.title = 'Changed'
+        self.episode.save()
+        routers.time = Clock(settings.REPLICA_PIN_SECONDS - 1)
+        self.assertEqual(routers.read_database(), 'default')
+        routers.time = Clock(settings.REPLICA_PIN_SECONDS + 1)
+        self.assertEqual(routers.read_database(), 'replica')
+        episode = self.get_episode().context['object']
+        self.assertEqual(episode._state.db, 'replica')
+        # Not replicated yet
+        self.assertEqual(episode.title, 'First Episode')
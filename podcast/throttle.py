@@ -0,0 +1,69 @@
+"""
+Token-bucket throttling of feed polls.
+
+Each client has a bucket per feed in the cache, holding up to
+``PODCAST_THROTTLE_BURST`` tokens and refilled at
+``PODCAST_THROTTLE_RATE`` tokens per hour. A poll takes a token; a client
+with an empty bucket is answered from the cache without rendering
+anything. Buckets are read and written without locking, so a burst of
+parallel polls may get slightly more than its share.
+"""
+import hashlib
+import math
+import time
+
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from podcast import feedcache, settings
+
+BUCKET_KEY = 'podcast:bucket:%s'
+
+
+def client_id(request):
+    """Identifies the client of ``request`` as set by THROTTLE_BY."""
+    parts = []
+    if settings.THROTTLE_BY in ('ip', 'both'):
+        parts.append(request.META.get('REMOTE_ADDR', ''))
+    if settings.THROTTLE_BY in ('user-agent', 'both'):
+        parts.append(request.META.get('HTTP_USER_AGENT', ''))
+    return '|'.join(parts)
+
+
+def take(request):
+    """
+    Takes a token from the bucket of the client and feed of ``request``.
+    Returns 0 if there was one, or the seconds until there is.
+    """
+    if not settings.THROTTLE_RATE:
+        return 0
+    key = BUCKET_KEY % hashlib.md5('%s|%s' % (client_id(request),
+        request.path)).hexdigest()
+    rate = settings.THROTTLE_RATE / 3600.0
+    burst = settings.THROTTLE_BURST
+    now = time.time()
+    tokens, stamp = cache.get(key, (burst, now))
+    tokens = min(burst, tokens + (now - stamp) * rate)
+    wait = 0
+    if tokens >= 1:
+        tokens -= 1
+    else:
+        wait = int(math.ceil((1 - tokens) / rate))
+    # A bucket left alone this long is full again anyway.
+    cache.set(key, (tokens, now), int(math.ceil(burst / rate)))
+    return wait
+
+
+def throttled(request, slug, name, wait):
+    """
+    Answers a throttled poll: ``304 Not Modified`` if the client has the
+    cached document, else ``429 Too Many Requests``.
+    """
+    entry = cache.get(feedcache.document_key(slug, name))
+    if entry is not None and feedcache.etag_matches(
+            request.META.get('HTTP_IF_NONE_MATCH', ''), entry['digest']):
+        return feedcache.serve_entry(request, entry)
+    response = HttpResponse('Too many requests, retry in %d seconds.\n' %
+        wait, status=429, content_type='text/plain')
+    response['Retry-After'] = str(wait)
+    return response
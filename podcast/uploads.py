@@ -0,0 +1,333 @@
+"""
+Resumable, chunked uploads of enclosure files.
+
+A client starts an upload with the file name and size, then sends the file
+in order as chunks of at most ``PODCAST_UPLOAD_CHUNK_SIZE`` bytes, each
+with a ``Content-Range`` and a ``Digest: SHA-256=...`` (or ``Content-MD5``)
+header. Every chunk is verified and written to storage on its own, so
+memory use does not grow with the file. An interrupted upload resumes from
+the offset returned by a ``GET``. After the last chunk, a background
+worker streams the parts into the final file in one pass which also
+computes its hash; the client polls with ``GET`` until the upload is
+complete. The hash is not kept up as chunks arrive because hash state
+cannot be stored between requests, which may reach different processes,
+and the parts are read once for assembling anyway. The MIME type is sniffed from the first chunk.
+
+Endpoints, mounted in the admin by ``EnclosureAdmin``:
+
+    POST   upload/           filename, size -> token, offset, chunk_size
+    GET    upload/<token>/   -> offset, complete
+    PUT    upload/<token>/   one chunk -> offset, complete
+    DELETE upload/<token>/   abandons the upload
+"""
+import base64
+import datetime
+import hashlib
+import logging
+import os
+import re
+import uuid
+
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseBadRequest, \
+    HttpResponseForbidden, HttpResponseNotAllowed
+from django.shortcuts import get_object_or_404
+from django.utils import simplejson
+from django.utils.encoding import smart_str
+
+from podcast import settings
+from podcast.models import Enclosure, Upload
+from podcast.worker import BatchWorker
+
+logger = logging.getLogger('podcast.uploads')
+
+PARTS_DIR = 'podcasts/uploads/%s/'
+HASHES = {'MD5': hashlib.md5, 'SHA-1': hashlib.sha1}
+RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+def sniff_mime(head):
+    """Guesses the MIME type of a file from its first bytes."""
+    if head[4:8] == 'ftyp':
+        brand = head[8:12]
+        if brand.startswith('M4A') or brand.startswith('M4B'):
+            return 'audio/x-m4a'
+        if brand.startswith('M4V'):
+            return 'video/x-m4v'
+        if brand == 'qt  ':
+            return 'video/quicktime'
+        return 'video/mp4'
+    if head[:4] in ('moov', 'mdat', 'wide', 'free') or head[4:8] in (
+            'moov', 'mdat', 'wide'):
+        return 'video/quicktime'
+    if head[:3] == 'ID3' or (head[:1] == '\xff' and
+                             ord(head[1:2] or '\0') & 0xe0 == 0xe0):
+        return 'audio/mpeg'
+    if head[:4] == 'OggS':
+        return 'audio/ogg'
+    if head[:4] == '%PDF':
+        return 'application/pdf'
+    if head[:3] == '\xff\xd8\xff':
+        return 'image/jpeg'
+    return ''
+
+
+def part_name(upload, index):
+    return PARTS_DIR % upload.token + '%06d' % index
+
+
+def verify_digest(request, data):
+    """
+    Checks a chunk against its ``Digest`` or ``Content-MD5`` header.
+    Returns ``False`` if a header is present and does not match.
+    """
+    for digest in request.META.get('HTTP_DIGEST', '').split(','):
+        algo, _, value = digest.strip().partition('=')
+        if algo.lower() == 'sha-256':
+            return base64.b64decode(value) == hashlib.sha256(data).digest()
+    md5 = request.META.get('HTTP_CONTENT_MD5')
+    if md5:
+        return base64.b64decode(md5) == hashlib.md5(data).digest()
+    return True
+
+
+def discard(upload):
+    """Deletes an upload and its stored chunks."""
+    for index in range(upload.chunks):
+        name = part_name(upload, index)
+        if default_storage.exists(name):
+            default_storage.delete(name)
+    upload.delete()
+
+
+def discard_expired():
+    expired = datetime.datetime.now() - datetime.timedelta(
+        seconds=settings.UPLOAD_EXPIRE)
+    for upload in Upload.objects.filter(created__lt=expired, name=''):
+        discard(upload)
+
+
+def start(user, filename, size):
+    discard_expired()
+    return Upload.objects.create(token=uuid.uuid4().hex, user=user,
+        filename=os.path.basename(filename), size=size)
+
+
+def store_chunk(upload, offset, data):
+    """
+    Stores the chunk starting at ``offset``. Returns ``False`` if that is
+    not where the upload continues, e.g. because a retried chunk already
+    arrived.
+    """
+    if offset != upload.received or offset + len(data) > upload.size:
+        return False
+    name = part_name(upload, upload.chunks)
+    if default_storage.exists(name):
+        # Left over from an attempt that failed before it was recorded.
+        default_storage.delete(name)
+    default_storage.save(name, ContentFile(data))
+    values = {'received': offset + len(data), 'chunks': upload.chunks + 1}
+    if offset == 0:
+        values['mime'] = sniff_mime(data[:16])
+    if not Upload.objects.filter(pk=upload.pk, received=offset,
+            chunks=upload.chunks).update(**values):
+        return False
+    for key, value in values.items():
+        setattr(upload, key, value)
+    return True
+
+
+class AssembledFile(File):
+    """
+    Reads the stored chunks of an upload in order as one file, hashing the
+    bytes as they pass through to the storage backend.
+    """
+
+    def __init__(self, upload, algo):
+        super(AssembledFile, self).__init__(None, upload.filename)
+        self.upload = upload
+        self.hasher = HASHES[algo]()
+        self.size = upload.size
+        self.bytes_read = 0
+        self._parts = self._read_parts()
+        self._buffer = ''
+
+    def _read_parts(self):
+        for index in range(self.upload.chunks):
+            part = default_storage.open(part_name(self.upload, index), 'rb')
+            try:
+                for data in part.chunks():
+                    self.hasher.update(data)
+                    self.bytes_read += len(data)
+                    yield data
+            finally:
+                part.close()
+
+    def chunks(self, chunk_size=None):
+        if self._buffer:
+            yield self._buffer
+            self._buffer = ''
+        for data in self._parts:
+            yield data
+
+    def __iter__(self):
+        return self.chunks()
+
+    def read(self, num_bytes=None):
+        while num_bytes is None or num_bytes < 0 or \
+                len(self._buffer) < num_bytes:
+            try:
+                self._buffer += self._parts.next()
+            except StopIteration:
+                break
+        if num_bytes is None or num_bytes < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data = self._buffer[:num_bytes]
+            self._buffer = self._buffer[num_bytes:]
+        return data
+
+    def close(self):
+        pass
+
+
+def _stale_claim():
+    return datetime.datetime.now() - datetime.timedelta(
+        seconds=settings.UPLOAD_ASSEMBLY_TIMEOUT)
+
+
+def _restart(upload, claimed):
+    """Deletes the chunks of an upload so it is received again."""
+    for index in range(upload.chunks):
+        if default_storage.exists(part_name(upload, index)):
+            default_storage.delete(part_name(upload, index))
+    Upload.objects.filter(pk=upload.pk, claimed=claimed).update(received=0,
+        chunks=0)
+    raise IOError('Upload %s is missing chunks.' % upload.token)
+
+
+def assemble(upload):
+    """
+    Streams the chunks into the enclosure's storage location, recording
+    the final name and hash, then deletes the chunks. Does nothing if
+    another process is already assembling the upload. If assembling
+    fails, the claim is released so the next poll queues it again; if
+    chunks are missing, the upload starts over from the first chunk.
+    """
+    algo = settings.UPLOAD_HASH_ALGO
+    claimed = datetime.datetime.now()
+    if not Upload.objects.filter(Q(algo='') | Q(claimed=None) |
+            Q(claimed__lt=_stale_claim()), pk=upload.pk, name='').update(
+            algo=algo, claimed=claimed):
+        return upload
+    try:
+        for index in range(upload.chunks):
+            if not default_storage.exists(part_name(upload, index)):
+                _restart(upload, claimed)
+        content = AssembledFile(upload, algo)
+        field = Enclosure._meta.get_field('file')
+        name = field.generate_filename(None, upload.filename)
+        name = field.storage.save(name, content)
+        if content.bytes_read != upload.size:
+            field.storage.delete(name)
+            _restart(upload, claimed)
+    except Exception:
+        Upload.objects.filter(pk=upload.pk, claimed=claimed).update(
+            algo='', claimed=None)
+        raise
+    upload.name = name
+    upload.algo = algo
+    upload.claimed = claimed
+    upload.hash = content.hasher.hexdigest()
+    for index in range(upload.chunks):
+        default_storage.delete(part_name(upload, index))
+    upload.save()
+    return upload
+
+
+def _assemble_batch(batch):
+    for upload in Upload.objects.filter(pk__in=batch.keys()):
+        try:
+            assemble(upload)
+        except Exception:
+            logger.exception('Assembling upload %s failed', upload.token)
+
+assembler = BatchWorker(_assemble_batch, name='podcast-uploads')
+
+
+def queue_assembly(upload):
+    if upload.received != upload.size or upload.name:
+        return
+    if not upload.algo or upload.claimed is None or \
+            upload.claimed < _stale_claim():
+        assembler.add(upload.pk, upload.pk)
+
+
+def attach(enclosure, upload):
+    """Points ``enclosure`` at the file of a completed upload."""
+    enclosure.file.name = upload.name
+    enclosure.size = upload.size
+    enclosure.algo = upload.algo
+    enclosure.hash = upload.hash
+    if upload.mime:
+        enclosure.mime = upload.mime
+    upload.delete()
+
+
+def _json(data, status=200):
+    return HttpResponse(simplejson.dumps(data), status=status,
+        mimetype='application/json')
+
+
+def _state(upload):
+    return {'token': upload.token, 'offset': upload.received,
+            'size': upload.size, 'complete': upload.complete(),
+            'chunk_size': settings.UPLOAD_CHUNK_SIZE}
+
+
+def start_view(request):
+    if not request.user.has_perm('podcast.add_enclosure'):
+        return HttpResponseForbidden()
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    try:
+        size = int(request.POST['size'])
+        filename = smart_str(request.POST['filename'])
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest('filename and size are required.')
+    if size <= 0:
+        return HttpResponseBadRequest('The file is empty.')
+    return _json(_state(start(request.user, filename, size)), status=201)
+
+
+def upload_view(request, token):
+    upload = get_object_or_404(Upload, token=token, user=request.user)
+    if request.method == 'GET':
+        # Picks up uploads whose assembly was lost with a restart.
+        queue_assembly(upload)
+        return _json(_state(upload))
+    if request.method == 'DELETE':
+        discard(upload)
+        return HttpResponse(status=204)
+    if request.method not in ('PUT', 'POST'):
+        return HttpResponseNotAllowed(['GET', 'PUT', 'POST', 'DELETE'])
+    match = RANGE_RE.match(request.META.get('HTTP_CONTENT_RANGE', ''))
+    if not match or int(match.group(3)) != upload.size:
+        return HttpResponseBadRequest('A Content-Range header is required.')
+    length = int(request.META.get('CONTENT_LENGTH') or 0)
+    if length > settings.UPLOAD_CHUNK_SIZE:
+        return _json(_state(upload), status=413)
+    data = request.raw_post_data
+    offset = int(match.group(1))
+    if len(data) != int(match.group(2)) - offset + 1:
+        return HttpResponseBadRequest('Content-Range does not match the body.')
+    if not verify_digest(request, data):
+        return HttpResponseBadRequest('The chunk digest does not match.')
+    if not store_chunk(upload, offset, data):
+        # Tell the client where to continue.
+        upload = Upload.objects.get(pk=upload.pk)
+        return _json(_state(upload), status=409)
+    queue_assembly(upload)
+    return _json(_state(upload))
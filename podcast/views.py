@@ -1,5 +1,27 @@
+from django.shortcuts import get_object_or_404, render_to_response
+from django.template import RequestContext
 from django.views.generic.list_detail import object_detail, object_list
+from podcast import delta, settings, throttle, websub
+from podcast.feedcache import cached_document
+from podcast.managers import EPISODE_LIST_FIELDS, EPISODE_SITEMAP_FIELDS, \
+    EPISODE_FEED_FIELDS, EPISODE_ATOM_FIELDS, EPISODE_MEDIA_DEFERRED, \
+    EPISODE_RELATED_FIELDS, SHOW_LIST_FIELDS
 from podcast.models import Episode, Show, Enclosure
+from podcast.routers import read_database
+
+
+def _cached_page(request, slug, render):
+    """
+    Serves an HTML page of the show with ``slug`` from the document cache to 
+    anonymous visitors, if ``PODCAST_PAGE_CACHE`` is on. The pages read no 
+    query parameters, so they are cached by path alone; otherwise every 
+    made-up query string would cost a render and a cache entry.
+    """
+    user = getattr(request, 'user', None)
+    if not settings.PAGE_CACHE or request.method != 'GET' or \
+            (user is not None and user.is_authenticated()):
+        return render()
+    return cached_document(request, slug, 'page:%s' % request.path, render)
 
 
 def episode_detail(request, show_slug, episode_slug):
@@ -8,21 +30,31 @@ def episode_detail(request, show_slug, episode_slug):
 
     Template:  ``podcast/episode_detail.html``
     Context:
-        object_detail
+        object
             Detail of episode.
+        enclosure_list
+            Enclosures of the episode, without the broken ones.
+        related_list
+            Published related episodes, most similar first.
+        fragment_timeout
+            Seconds to cache the rendered episode.
     """
-    return object_detail(
-        request=request,
-        queryset=Episode.objects.published().filter(
-            show__slug__exact=show_slug),
-        slug=episode_slug,
-        slug_field='slug',
-        extra_context={
-            'enclosure_list': Enclosure.objects.filter(
-                                episode__show__slug__exact=show_slug).filter(
-                                    episode__slug__exact=episode_slug
-                                        ).order_by('-episode__date')},
-        template_name='podcast/episode_detail.html')
+    def render():
+        db = read_database()
+        episode = get_object_or_404(
+            Episode.objects.published().using(db).select_related('show'), 
+            show__slug__exact=show_slug, slug__exact=episode_slug)
+        return render_to_response('podcast/episode_detail.html', {
+            'object': episode,
+            'enclosure_list': episode.healthy_enclosures(),
+            # Precomputed by podcast.related
+            'related_list': Episode.objects.published().using(db).filter(
+                related_by__episode=episode).select_related('show').only(
+                    *EPISODE_RELATED_FIELDS).order_by('related_by__rank'),
+            'fragment_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
+        }, context_instance=RequestContext(request))
+
+    return _cached_page(request, show_slug, render)
 
 
 def episode_list(request, slug):
@@ -33,17 +65,25 @@ def episode_list(request, slug):
     Context:
         object_list
             List of episodes.
+        fragment_timeout
+            Seconds to cache each rendered episode.
     """
-    return object_detail(
-        request=request,
-        queryset=Show.objects.all(),
-        slug_field='slug',
-        slug=slug,
-        extra_context={
-            'object_list': Episode.objects.published().filter(
-                show__slug__exact=slug),
-        },
-        template_name='podcast/episode_list.html')
+    def render():
+        db = read_database()
+        return object_detail(
+            request=request,
+            queryset=Show.objects.using(db),
+            slug_field='slug',
+            slug=slug,
+            extra_context={
+                'object_list': Episode.objects.published().using(db).filter(
+                    show__slug__exact=slug).select_related('show').only(
+                        *EPISODE_LIST_FIELDS),
+                'fragment_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
+            },
+            template_name='podcast/episode_list.html')
+
+    return _cached_page(request, slug, render)
 
 
 def episode_sitemap(request, slug):
@@ -55,15 +95,22 @@ def episode_sitemap(request, slug):
         object_list
             List of episodes.
     """
-    return object_list(
-        request,
-        mimetype='application/xml',
-        queryset=Episode.objects.published().filter(
-            show__slug__exact=slug).order_by('-date'),
-        extra_context={
-            'enclosure_list': Enclosure.objects.filter(
-                episode__show__slug__exact=slug).order_by('-episode__date')},
-        template_name='podcast/episode_sitemap.html')
+    def render():
+        db = read_database()
+        return object_list(
+            request,
+            mimetype='application/xml',
+            queryset=Episode.objects.published().using(db).filter(
+                show__slug__exact=slug).select_related('show').only(
+                    *EPISODE_SITEMAP_FIELDS).order_by('-date'),
+            extra_context={
+                'enclosure_list': Enclosure.objects.using(db).filter(
+                    episode__show__slug__exact=slug).order_by(
+                        '-episode__date')},
+            template_name='podcast/episode_sitemap.html')
+
+    return cached_document(request, slug, 'podcast/episode_sitemap.html', 
+        render)
 
 
 def show_list(request, slug=None, template_name='podcast/show_list.html', 
@@ -78,10 +125,9 @@ def show_list(request, slug=None, template_name='podcast/show_list.html',
             List of shows.
     """
 
+    shows = Show.objects.using(read_database()).only(*SHOW_LIST_FIELDS)
     if slug:
-        shows = Show.objects.filter(slug__exact=slug)
-    else:
-        shows = Show.objects.all()
+        shows = shows.filter(slug__exact=slug)
 
     return object_list(
         request=request,
@@ -91,6 +137,39 @@ def show_list(request, slug=None, template_name='podcast/show_list.html',
         page=page)
 
 
+def _show_feed(request, slug, template_name, view_name, project, 
+    deltas=False):
+    """
+    Renders a feed of the show with ``slug`` through the document cache. 
+    ``project`` restricts the published episodes to the columns the feed 
+    renders. With ``deltas``, RFC 3229 ``A-IM: feed`` requests get only the 
+    episodes changed since the version the client has.
+    """
+    wait = throttle.take(request)
+    if wait:
+        return throttle.throttled(request, slug, template_name, wait)
+
+    def render(since=None):
+        db = read_database()
+        show = get_object_or_404(Show.objects.using(db), slug__exact=slug)
+        context = websub.feed_context(request, view_name, slug)
+        episodes = Episode.objects.published().using(db).filter(
+            show__slug__exact=slug)
+        if since is not None:
+            episodes = delta.changed_since(episodes, since)
+        context['object'] = show
+        context['episode_list'] = project(episodes)
+        response = render_to_response(template_name, context, 
+            context_instance=RequestContext(request), 
+            mimetype='application/rss+xml')
+        response['Cache-Control'] = 'max-age=%d' % (show.feed_ttl() * 60)
+        return response
+
+    if deltas:
+        return delta.cached_feed(request, slug, template_name, render)
+    return cached_document(request, slug, template_name, render)
+
+
 def show_list_atom(request, slug, 
     template_name='podcast/show_feed_atom.html'):
     """
@@ -100,13 +179,15 @@ def show_list_atom(request, slug,
     Context:
         object
             Story detail
+        episode_list
+            Published episodes of the show.
+        self_url
+            Absolute URL of this feed.
+        websub_hubs
+            WebSub hubs to advertise.
     """
-    return object_detail(request,
-        queryset=Show.objects.all(),
-        mimetype='application/rss+xml',
-        slug_field='slug',
-        slug=slug,
-        template_name=template_name)
+    return _show_feed(request, slug, template_name, 'podcast_atom', 
+        lambda episodes: episodes.only(*EPISODE_ATOM_FIELDS), deltas=True)
 
 
 def show_list_feed(request, slug, template_name='podcast/show_feed.html'):
@@ -117,13 +198,15 @@ def show_list_feed(request, slug, template_name='podcast/show_feed.html'):
     Context:
         object
             Story detail
+        episode_list
+            Published episodes of the show.
+        self_url
+            Absolute URL of this feed.
+        websub_hubs
+            WebSub hubs to advertise.
     """
-    return object_detail(request,
-        queryset=Show.objects.all(),
-        mimetype='application/rss+xml',
-        slug_field='slug',
-        slug=slug,
-        template_name=template_name)
+    return _show_feed(request, slug, template_name, 'podcast_feed', 
+        lambda episodes: episodes.only(*EPISODE_FEED_FIELDS), deltas=True)
 
 
 def show_list_media(request, slug, 
@@ -135,10 +218,13 @@ def show_list_media(request, slug,
     Context:
         object
             Story detail
+        episode_list
+            Published episodes of the show.
+        self_url
+            Absolute URL of this feed.
+        websub_hubs
+            WebSub hubs to advertise.
     """
-    return object_detail(request,
-        queryset=Show.objects.all(),
-        mimetype='application/rss+xml',
-        slug_field='slug',
-        slug=slug,
-        template_name=template_name)
+    return _show_feed(request, slug, template_name, 'podcast_media', 
+        lambda episodes: episodes.select_related('show').defer(
+            *EPISODE_MEDIA_DEFERRED))
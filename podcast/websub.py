@@ -0,0 +1,133 @@
+"""
+WebSub (PubSubHubbub) publishing.
+
+Each show's RSS, Atom and Media RSS feeds advertise the configured hubs.
+When a show changes, the hubs are told to fetch the feeds again. Pings
+are sent from a background worker: changes to a show within
+``PODCAST_WEBSUB_DELAY`` seconds are coalesced into one ping, the topics
+of all shows due at the same time are batched into one request per hub,
+and failed requests are retried with exponential backoff.
+
+Not every change to a show changes its feeds; drafts, aggregates and the
+like do not. Before pinging, the worker takes a fingerprint of what the
+feeds publish, the show and the update times of its public episodes, and
+only pings a hub if it differs from the one of the last ping.
+"""
+import hashlib
+import logging
+import urllib
+import urllib2
+
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+
+from podcast import feedcache, settings
+from podcast.worker import BatchWorker
+
+logger = logging.getLogger('podcast.websub')
+
+FEEDS = ('podcast_feed', 'podcast_atom', 'podcast_media')
+PINGED_KEY = 'podcast:websub:%s:%s'
+
+
+def base_url():
+    if settings.WEBSUB_BASE_URL:
+        return settings.WEBSUB_BASE_URL.rstrip('/')
+    return 'http://%s' % Site.objects.get_current().domain
+
+
+def topic_url(view_name, slug, request=None):
+    """
+    Returns the absolute URL of a feed as announced to hubs. Feeds link to
+    themselves with the same URL, so it must not depend on the request
+    unless no base URL is configured.
+    """
+    path = reverse(view_name, kwargs={'slug': slug})
+    if request is not None and not settings.WEBSUB_BASE_URL:
+        return request.build_absolute_uri(path)
+    return base_url() + path
+
+
+def feed_context(request, view_name, slug):
+    """Template context for the ``rel="self"`` and ``rel="hub"`` links."""
+    return {
+        'self_url': topic_url(view_name, slug, request),
+        'websub_hubs': settings.WEBSUB_HUBS,
+    }
+
+
+def ping_hub(hub, topics):
+    """Notifies ``hub`` that ``topics`` have new content."""
+    data = [('hub.mode', 'publish')] + [('hub.url', t) for t in topics]
+    response = urllib2.urlopen(urllib2.Request(hub, urllib.urlencode(data)),
+        timeout=settings.WEBSUB_TIMEOUT)
+    try:
+        if not 200 <= response.code < 300:
+            raise IOError('hub %s answered %s' % (hub, response.code))
+    finally:
+        response.close()
+
+
+def fingerprint(slug):
+    """
+    Returns a digest of what the feeds of the show with ``slug`` publish:
+    the show and the public episodes with their update times.
+    """
+    from podcast.models import Episode, Show
+    shows = [sorted(values.items()) for values in
+             Show.objects.filter(slug=slug).values()]
+    episodes = list(Episode.objects.published().filter(show__slug=slug
+        ).order_by('pk').values_list('pk', 'update'))
+    return hashlib.md5(repr((shows, episodes))).hexdigest()
+
+
+def _pinged_key(hub, slug):
+    return PINGED_KEY % (hashlib.md5(hub).hexdigest(), slug)
+
+
+def publish(batch):
+    """
+    Handles a batch of ``{(hub, slug): attempt}`` items, sending one ping
+    per hub for the shows whose feeds changed since its last ping and
+    scheduling failed ones again.
+    """
+    fingerprints = {}
+    by_hub = {}
+    for (hub, slug), attempt in batch.items():
+        if slug not in fingerprints:
+            fingerprints[slug] = fingerprint(slug)
+        if cache.get(_pinged_key(hub, slug)) != fingerprints[slug]:
+            by_hub.setdefault(hub, []).append((slug, attempt))
+    for hub, items in by_hub.items():
+        topics = []
+        for slug, attempt in items:
+            topics.extend(topic_url(view_name, slug) for view_name in FEEDS)
+        try:
+            ping_hub(hub, topics)
+            for slug, attempt in items:
+                cache.set(_pinged_key(hub, slug), fingerprints[slug],
+                    feedcache.VERSION_TIMEOUT)
+        except (IOError, urllib2.URLError) as e:
+            for slug, attempt in items:
+                if attempt + 1 >= settings.WEBSUB_RETRIES:
+                    logger.error('Giving up pinging %s for %s: %s',
+                        hub, slug, e)
+                    continue
+                worker.add((hub, slug), attempt + 1,
+                    settings.WEBSUB_BACKOFF * 2 ** attempt)
+
+worker = BatchWorker(publish, name='podcast-websub')
+
+
+def schedule_ping(slug, delay=None):
+    if delay is None:
+        delay = settings.WEBSUB_DELAY
+    for hub in settings.WEBSUB_HUBS:
+        worker.add((hub, slug), 0, delay)
+
+
+def ping_changed_shows(sender, shows, **kwargs):
+    for show in shows:
+        schedule_ping(show.slug)
+
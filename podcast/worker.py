@@ -0,0 +1,86 @@
+"""
+A coalescing background worker.
+
+Items are added under a key with a delay. Adding a key that is already
+pending keeps the earlier due time, so a burst of changes to the same
+thing collapses into one item. Due items are handed to the handler in a
+single batch from a daemon thread, which is started on first use.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger('podcast.worker')
+
+
+class BatchWorker(object):
+
+    def __init__(self, handler, name='podcast-worker'):
+        self.handler = handler
+        self.name = name
+        self.pending = {}
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def add(self, key, value, delay=0):
+        """Schedules ``value`` under ``key`` to be handled after ``delay``."""
+        due = time.time() + delay
+        self.condition.acquire()
+        try:
+            if key not in self.pending or self.pending[key][0] > due:
+                self.pending[key] = (due, value)
+            self._start()
+            self.condition.notify()
+        finally:
+            self.condition.release()
+
+    def take(self, now=None, all=False):
+        """Removes and returns the due items as a ``{key: value}`` dict."""
+        if now is None:
+            now = time.time()
+        self.condition.acquire()
+        try:
+            due = [key for key, (when, value) in self.pending.items()
+                   if all or when <= now]
+            return dict((key, self.pending.pop(key)[1]) for key in due)
+        finally:
+            self.condition.release()
+
+    def flush(self):
+        """Handles every pending item right away, in the calling thread."""
+        batch = self.take(all=True)
+        if batch:
+            self.handler(batch)
+
+    def _start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, name=self.name)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def _wait(self):
+        self.condition.acquire()
+        try:
+            while True:
+                if self.pending:
+                    timeout = min(
+                        when for when, value in self.pending.values()
+                        ) - time.time()
+                    if timeout <= 0:
+                        return
+                else:
+                    timeout = None
+                self.condition.wait(timeout)
+        finally:
+            self.condition.release()
+
+    def _run(self):
+        while True:
+            self._wait()
+            batch = self.take()
+            if not batch:
+                continue
+            try:
+                self.handler(batch)
+            except Exception:
+                logger.exception('%s failed to handle a batch', self.name)